@@ -0,0 +1,46 @@
+"""Reusable audio buffers for the STT hot path.
+
+Float32 arrays are pooled by power-of-two size class so a request can
+borrow a buffer at least as large as it needs. The pool is thread-safe
+since model calls run in worker threads.
+"""
+
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+import numpy as np
+
+MAX_POOLED = 8  # buffers kept per size class
+
+_lock = threading.Lock()
+_f32_pool: Dict[int, Deque[np.ndarray]] = {}
+
+
+def _size_class(n: int) -> int:
+    return 1 << max(n - 1, 1023).bit_length()
+
+
+def acquire_f32(n: int) -> np.ndarray:
+    """Borrow a float32 array with at least `n` samples (contents undefined)."""
+    size = _size_class(n)
+    with _lock:
+        pool = _f32_pool.get(size)
+        if pool:
+            return pool.pop()
+    return np.empty(size, dtype=np.float32)
+
+
+def release_f32(arr: np.ndarray) -> None:
+    """Return an array obtained from acquire_f32 (not a slice of it)."""
+    with _lock:
+        pool = _f32_pool.setdefault(arr.shape[0], deque())
+        if len(pool) < MAX_POOLED:
+            pool.append(arr)
+
+
+def reserve_f32(n: int, count: int = 1) -> None:
+    """Preallocate `count` arrays able to hold `n` samples."""
+    for _ in range(count):
+        release_f32(np.empty(_size_class(n), dtype=np.float32))
+
@@ -4,20 +4,50 @@ import os
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 LLM_MODEL = os.getenv("LLM_MODEL", "qwen2.5:1b")
 
+TORCH_DEVICE = os.getenv("TORCH_DEVICE", "cpu")
+
 # Whisper / STT
 WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "qymyz/whisper-tiny-russian-dysarthria")
+WHISPER_COMPUTE = os.getenv(  # CTranslate2 compute type
+    "WHISPER_COMPUTE", "int8_float16" if TORCH_DEVICE == "cuda" else "int8"
+)
+WHISPER_CT2_DIR = os.getenv("WHISPER_CT2_DIR", "/root/.cache/ct2")  # converted HF checkpoints
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "ct2")  # "ct2" (faster-whisper) or "onnx"
+WHISPER_ONNX_DIR = os.getenv("WHISPER_ONNX_DIR", "/app/models/whisper-onnx")  # scripts/export_whisper_onnx.py output
+WHISPER_FLASH_ATTENTION = os.getenv("WHISPER_FLASH_ATTENTION", "1") == "1"  # CUDA only; needs a CTranslate2 build with it
+STT_VAD = os.getenv("STT_VAD", "1") == "1"  # drop silence with Silero VAD before encoding
+STT_MAX_BATCH = int(os.getenv("STT_MAX_BATCH", "8"))  # requests coalesced per encoder pass
+STT_MAX_WAIT_MS = int(os.getenv("STT_MAX_WAIT_MS", "8"))  # how long to wait for a batch to fill
 
 # TTS
 XTTS_LANG = os.getenv("XTTS_LANG", "ru")
 XTTS_VOICE = os.getenv("XTTS_VOICE", "Gracie Wise")
 TTS_FORMAT = os.getenv("TTS_FORMAT", "mp3")
+TTS_MAX_BATCH = int(os.getenv("TTS_MAX_BATCH", "4"))  # requests drained per TTS thread hop
+TTS_MAX_WAIT_MS = int(os.getenv("TTS_MAX_WAIT_MS", "10"))
+TTS_CACHE_MB = int(os.getenv("TTS_CACHE_MB", "64"))  # encoded outputs kept for repeated requests
 
 # Runtime
-TORCH_DEVICE = os.getenv("TORCH_DEVICE", "cpu")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", max((os.cpu_count() or 2) // 2, 1)))  # ~physical cores
+
+# XTTS acceleration (CPU compile needs a C++ toolchain, so default to CUDA only)
+XTTS_COMPILE = os.getenv("XTTS_COMPILE", "1" if TORCH_DEVICE == "cuda" else "0") == "1"
+XTTS_AUTOCAST = os.getenv("XTTS_AUTOCAST", "1" if TORCH_DEVICE == "cuda" else "0") == "1"
+# XTTS GPT weights: fp32, fp16, bf16, or int8 (dynamic quantization, CPU only)
+XTTS_DTYPE = os.getenv("XTTS_DTYPE", "fp16" if TORCH_DEVICE == "cuda" else "fp32")
+if XTTS_DTYPE not in ("fp32", "fp16", "bf16", "int8"):
+    raise ValueError(f"XTTS_DTYPE must be fp32, fp16, bf16 or int8, got {XTTS_DTYPE!r}")
+if XTTS_DTYPE == "int8" and TORCH_DEVICE != "cpu":
+    # quantize_dynamic's quantized Linear layers have no CUDA kernels
+    raise ValueError(f"XTTS_DTYPE=int8 needs TORCH_DEVICE=cpu, got {TORCH_DEVICE!r}")
+XTTS_VOCODER = os.getenv("XTTS_VOCODER", "torch")  # "torch" or "onnx" (HiFi-GAN on ONNX Runtime)
+XTTS_VOCODER_ONNX = os.getenv("XTTS_VOCODER_ONNX", "/app/models/xtts-hifigan.onnx")  # scripts/export_xtts_onnx.py output
 
 # Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SECRET_KEY = os.getenv("SUPABASE_SECRET_KEY")
+CDN_BASE_URL = os.getenv("CDN_BASE_URL", "").rstrip("/")  # CDN in front of public storage buckets
 
 # Limits
 MAX_AUDIO_BYTES = 15 * 1024 * 1024  # 15 MB
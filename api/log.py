@@ -0,0 +1,69 @@
+"""Application logging.
+
+Records go onto an in-memory queue and are written to stderr by a
+background QueueListener, so request threads never block on stream I/O.
+uvicorn's own loggers (server and access log) are moved onto queues the
+same way, keeping their formatters.
+"""
+
+import logging
+import logging.handlers
+import queue
+from typing import List
+
+from config import LOG_LEVEL
+
+log = logging.getLogger("speakup")
+
+# uvicorn loggers that own handlers ("uvicorn.error" propagates to "uvicorn")
+_UVICORN_LOGGERS = ("uvicorn", "uvicorn.access")
+
+_listeners: List[logging.handlers.QueueListener] = []
+
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records untouched and leave formatting to the listener.
+
+    The stock prepare() merges args into the message, but uvicorn's access
+    formatter needs the original record.args. The queue is in-process, so
+    nothing has to be made picklable.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _start_listener(handlers: List[logging.Handler]) -> logging.Handler:
+    q: queue.Queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return _RecordQueueHandler(q)
+
+
+def setup_logging() -> None:
+    """Put the `speakup` and uvicorn loggers behind queue handlers and start the listeners."""
+    if _listeners:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log.addHandler(_start_listener([stream]))
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+
+    # uvicorn configures these before importing the app; move its handlers
+    # behind a queue so access/error logging is off the event loop too
+    for name in _UVICORN_LOGGERS:
+        logger = logging.getLogger(name)
+        handlers = list(logger.handlers)
+        if not handlers:
+            continue
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(_start_listener(handlers))
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener threads."""
+    while _listeners:
+        _listeners.pop().stop()
@@ -1,14 +1,20 @@
 import asyncio
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
-from routes import auth, chat, stt, tts, sprites, voices, session
-from services import supabase
-from services import tts as tts_service
-from services import stt as stt_service
-from services import chat as chat_service
+from log import log, setup_logging, shutdown_logging
 
-app = FastAPI(title="SpeakUP API")
+setup_logging()  # before service imports, which log at import time
+
+# Imported after setup_logging() on purpose, hence noqa: E402
+from routes import auth, chat, stt, tts, sprites, voices, session  # noqa: E402
+from services import supabase  # noqa: E402
+from services import tts as tts_service  # noqa: E402
+from services import stt as stt_service  # noqa: E402
+from services import chat as chat_service  # noqa: E402
+
+app = FastAPI(title="SpeakUP API", default_response_class=ORJSONResponse)
 
 # Register routes
 app.include_router(auth.router)
@@ -28,21 +34,26 @@ async def health():
 @app.on_event("startup")
 async def startup():
     """Warm up models and check connections on startup."""
-
     async def warmup_task():
         # Log Supabase status
         if supabase.is_configured():
-            print("Supabase configured")
+            log.info("Supabase configured")
         else:
-            print("Warning: Supabase not configured. Auth endpoints disabled.")
+            log.warning("Supabase not configured. Auth endpoints disabled.")
 
-        # Warm up TTS
-        tts_service.warmup()
+        # Model warmups are blocking; run them off the event loop
+        await asyncio.gather(
+            tts_service.warmup_async(),
+            asyncio.to_thread(stt_service.warmup),
+            chat_service.check_connection(),
+        )
 
-        # Warm up STT
-        stt_service.warmup()
+    asyncio.create_task(warmup_task())
 
-        # Check Ollama connection
-        await chat_service.check_connection()
 
-    asyncio.create_task(warmup_task())
\ No newline at end of file
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled connections."""
+    await chat_service.close()
+    await supabase.close()
+    shutdown_logging()
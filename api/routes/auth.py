@@ -13,15 +13,13 @@ class DeleteUserRequest(BaseModel):
 @router.post("/delete-user")
 async def delete_user(req: DeleteUserRequest):
     """Delete a user via Supabase Admin API."""
-    client = supabase.get_supabase()
-    if not client:
+    if not supabase.is_configured():
         raise HTTPException(
             status_code=503,
             detail="Service unavailable: Supabase not configured",
         )
     
-    response = client.auth.admin.delete_user(req.user_id)
-    if response is None:
+    if not await supabase.delete_user(req.user_id):
         raise HTTPException(status_code=500, detail="User doesn't exist")
     
     return {"ok": True}
\ No newline at end of file
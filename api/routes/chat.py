@@ -7,6 +7,7 @@ import httpx
 
 from services import chat
 from config import LLM_MODEL
+from log import log
 
 router = APIRouter(tags=["chat"])
 
@@ -25,11 +26,9 @@ async def chat_stream_endpoint(payload: dict):
     messages = payload.get("messages", [])
     # model from client is intentionally ignored
 
-    async def generate():
-        async for chunk in chat.chat_stream(messages):
-            yield chunk
-
-    return StreamingResponse(generate(), media_type="application/x-ndjson")
+    # chat_stream is an async generator, so Starlette iterates it on the
+    # event loop directly (sync iterators would go through the threadpool)
+    return StreamingResponse(chat.chat_stream(messages), media_type="application/x-ndjson")
 
 
 @router.post("/chat/sync")
@@ -43,8 +42,8 @@ async def chat_sync_endpoint(request: ChatSyncRequest):
         )
         return {"response": response}
     except httpx.HTTPError as e:
-        print(f"Ollama API Error: {e}")
+        log.error("Chat backend error: %s", e)
         raise HTTPException(status_code=500, detail=f"Ollama error: {str(e)}")
     except Exception as e:
-        print(f"General Error: {e}")
+        log.error("Chat error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
\ No newline at end of file
@@ -1,10 +1,13 @@
 from typing import Optional
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
 from fastapi.responses import JSONResponse, Response, RedirectResponse
 from pydantic import BaseModel
 
-from services.sprites import get_storage
+from services.sprites import get_storage, is_content_hashed, webp_variant
+from utils import read_upload
+from config import MAX_SPRITE_BYTES, CDN_BASE_URL
+from log import log
 
 router = APIRouter(tags=["sprites"], prefix="/sprites")
 
@@ -23,9 +26,9 @@ async def upload_pending_sprite(
 ):
     """Kid uploads their drawing for review."""
     storage = get_storage()
+    image_data = await read_upload(file, MAX_SPRITE_BYTES)
     try:
-        image_data = await file.read()
-        filename = storage.save_pending(
+        filename = await storage.save_pending(
             user_id=user_id,
             image_data=image_data,
             content_type=file.content_type,
@@ -35,7 +38,7 @@ async def upload_pending_sprite(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Pending upload error: {e}")
+        log.error("Pending upload error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
@@ -45,7 +48,7 @@ async def list_user_sprites(
 ):
     """List approved sprites available for this user."""
     storage = get_storage()
-    sprites = storage.list_approved(user_id)
+    sprites = await storage.list_approved(user_id)
     return JSONResponse({"user_id": user_id, "sprites": sprites})
 
 
@@ -55,19 +58,32 @@ async def list_my_pending_sprites(
 ):
     """List user's own pending sprites awaiting admin review."""
     storage = get_storage()
-    pending = storage.list_pending(user_id)
+    pending = await storage.list_pending(user_id)
     filenames = pending.get(user_id, [])
     return JSONResponse({"user_id": user_id, "pending": filenames})
 
 
 @router.get("/image/{user_id}/{filename}")
-async def get_sprite_image(user_id: str, filename: str):
-    """Serve approved sprite image."""
+async def get_sprite_image(user_id: str, filename: str, request: Request):
+    """Serve approved sprite image (WebP variant when the client accepts it)."""
     storage = get_storage()
-    url = storage.get_sprite_url(user_id, filename, pending=False)
+    webp = webp_variant(filename)
+    if webp and "image/webp" in request.headers.get("accept", ""):
+        filename = webp
+    url = await storage.get_sprite_url(user_id, filename, pending=False)
+    if url and CDN_BASE_URL and is_content_hashed(filename):
+        # Content-hashed names are never rewritten, so the CDN URL never changes
+        return RedirectResponse(
+            url=url,
+            status_code=301,
+            headers={"Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept"},
+        )
+    if url and CDN_BASE_URL:
+        # Legacy or unknown names may be replaced or missing; don't pin the redirect
+        return RedirectResponse(url=url, status_code=302, headers={"Vary": "Accept"})
     if url:
         return RedirectResponse(url=url)
-    image_bytes = storage.get_sprite_bytes(user_id, filename, pending=False)
+    image_bytes = await storage.get_sprite_bytes(user_id, filename, pending=False)
     if not image_bytes:
         raise HTTPException(status_code=404, detail="Sprite not found")
     media_type = "image/png"
@@ -86,7 +102,7 @@ async def list_pending_sprites(
 ):
     """[ADMIN] List all pending sprite uploads."""
     storage = get_storage()
-    pending = storage.list_pending(user_id)
+    pending = await storage.list_pending(user_id)
     return JSONResponse({"pending": pending})
 
 
@@ -94,10 +110,10 @@ async def list_pending_sprites(
 async def get_pending_sprite_image(user_id: str, filename: str):
     """[ADMIN] View pending sprite image for review."""
     storage = get_storage()
-    url = storage.get_sprite_url(user_id, filename, pending=True)
+    url = await storage.get_sprite_url(user_id, filename, pending=True)
     if url:
         return RedirectResponse(url=url)
-    image_bytes = storage.get_sprite_bytes(user_id, filename, pending=True)
+    image_bytes = await storage.get_sprite_bytes(user_id, filename, pending=True)
     if not image_bytes:
         raise HTTPException(status_code=404, detail="Pending sprite not found")
     media_type = "image/png"
@@ -116,9 +132,9 @@ async def approve_sprite(
 ):
     """[ADMIN] Upload approved sprite for a user."""
     storage = get_storage()
+    image_data = await read_upload(file, MAX_SPRITE_BYTES)
     try:
-        image_data = await file.read()
-        filename = storage.approve_sprite(
+        filename = await storage.approve_sprite(
             user_id=user_id,
             image_data=image_data,
             content_type=file.content_type,
@@ -128,7 +144,7 @@ async def approve_sprite(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Approve sprite error: {e}")
+        log.error("Approve sprite error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Approval failed: {str(e)}")
 
 
@@ -136,7 +152,7 @@ async def approve_sprite(
 async def delete_pending_sprite(user_id: str, filename: str):
     """[ADMIN] Delete a pending sprite after review."""
     storage = get_storage()
-    if storage.delete_pending(user_id, filename):
+    if await storage.delete_pending(user_id, filename):
         return JSONResponse({"ok": True, "message": "Pending sprite deleted"})
     else:
         raise HTTPException(status_code=404, detail="Pending sprite not found")
\ No newline at end of file
@@ -1,11 +1,13 @@
+import asyncio
 from typing import Optional
 
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 from services import stt
-from utils import guess_audio_format
+from utils import guess_audio_format, read_upload
 from config import MAX_AUDIO_BYTES, MAX_AUDIO_SECONDS
+from log import log
 
 router = APIRouter(tags=["stt"])
 
@@ -16,38 +18,37 @@ async def stt_endpoint(
     language: Optional[str] = "ru",
 ):
     """Transcribe audio to text with speech metrics."""
-    data = await file.read()
+    data = await read_upload(file, MAX_AUDIO_BYTES)
     
     if not data:
         raise HTTPException(status_code=400, detail="Empty audio upload")
     
-    if len(data) > MAX_AUDIO_BYTES:
-        raise HTTPException(status_code=413, detail="Audio too large")
-    
     audio_format = guess_audio_format(file.content_type)
     
     try:
-        result = stt.transcribe(
-            audio_bytes=data,
-            audio_format=audio_format,
-            language=language,
-        )
+        # PyAV decode + resample is CPU-bound; keep it off the event loop
+        samples = await asyncio.to_thread(stt.decode, data, audio_format)
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=f"Could not decode audio ({file.content_type}). {e}",
         )
-    except Exception as e:
-        print(f"STT Error: {e}")
-        raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
     
-    if result.duration > MAX_AUDIO_SECONDS:
+    # Reject before spending a model call on it
+    duration = samples.shape[0] / stt.SAMPLE_RATE
+    if duration > MAX_AUDIO_SECONDS:
         raise HTTPException(
             status_code=400,
-            detail=f"Audio too long ({result.duration:.1f}s)",
+            detail=f"Audio too long ({duration:.1f}s)",
         )
     
-    return JSONResponse({
+    try:
+        result = await stt.transcribe(samples, language=language)
+    except Exception as e:
+        log.error("STT error: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
+    
+    return ORJSONResponse({
         "text": result.text,
         "duration": result.duration,
         "language": result.language,
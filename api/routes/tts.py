@@ -1,11 +1,18 @@
 from fastapi import APIRouter
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 
 from services import tts
 from config import XTTS_VOICE, XTTS_LANG, TTS_FORMAT
 
 router = APIRouter(tags=["tts"])
 
+# audio/L16 would mean big-endian samples (RFC 2586); the PCM body is
+# little-endian int16, which is what mobile audio sinks take as-is
+_STREAM_MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "pcm": f"audio/pcm; rate={tts.SAMPLE_RATE}; channels=1; encoding=s16le",
+}
+
 
 @router.get("/speakers")
 async def list_speakers():
@@ -28,7 +35,7 @@ async def tts_endpoint(payload: dict):
         text: Text to synthesize
         voice: Speaker/voice name (optional, uses default if not provided)
         lang: Language code (default: ru)
-        format: Output format - wav or mp3 (default: mp3)
+        format: Output format - mp3, wav or pcm (default: mp3)
     """
     text = payload.get("text", "")
     if not text or not text.strip():
@@ -38,7 +45,13 @@ async def tts_endpoint(payload: dict):
     lang = payload.get("lang", XTTS_LANG)
     fmt = payload.get("format", TTS_FORMAT)
     
-    audio_bytes = tts.synthesize(
+    # MP3 and raw PCM can be played as they arrive, so stream them. The
+    # first chunk is generated before responding, so errors still give a 500
+    if fmt in _STREAM_MEDIA_TYPES:
+        audio = await tts.synthesize_stream(text=text, voice=voice, lang=lang, output_format=fmt)
+        return StreamingResponse(audio, media_type=_STREAM_MEDIA_TYPES[fmt])
+    
+    audio_bytes = await tts.synthesize_async(
         text=text,
         voice=voice,
         lang=lang,
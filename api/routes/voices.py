@@ -6,8 +6,9 @@ from pydantic import BaseModel
 
 from services import voice_cloning
 from services import tts as tts_service
-from utils import guess_audio_format
+from utils import guess_audio_format, read_upload
 from config import MAX_AUDIO_BYTES
+from log import log
 
 router = APIRouter(tags=["voices"], prefix="/voices")
 
@@ -29,17 +30,11 @@ async def validate_voice_sample(
     Use this to give user feedback before processing.
     Returns validation status, warnings, and recommendations.
     """
-    data = await file.read()
+    data = await read_upload(file, MAX_AUDIO_BYTES)
     
     if not data:
         raise HTTPException(status_code=400, detail="Empty audio file")
     
-    if len(data) > MAX_AUDIO_BYTES:
-        raise HTTPException(
-            status_code=413, 
-            detail=f"File too large ({len(data) / 1024 / 1024:.1f}MB). Max: 15MB"
-        )
-    
     audio_format = guess_audio_format(file.content_type)
     result = voice_cloning.validate_audio(data, audio_format)
     
@@ -87,17 +82,11 @@ async def upload_voice(
     
     Optimal audio: 15-30 seconds of clear speech, minimal background noise.
     """
-    data = await file.read()
+    data = await read_upload(file, MAX_AUDIO_BYTES)
     
     if not data:
         raise HTTPException(status_code=400, detail="Empty audio file")
     
-    if len(data) > MAX_AUDIO_BYTES:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large ({len(data) / 1024 / 1024:.1f}MB). Max: 15MB"
-        )
-    
     audio_format = guess_audio_format(file.content_type)
     
     try:
@@ -119,7 +108,7 @@ async def upload_voice(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Voice upload error: {e}")
+        log.error("Voice upload error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 
@@ -184,7 +173,7 @@ async def preview_voice(
     
     try:
         # Use the cloned voice for TTS
-        audio_bytes = tts_service.synthesize_with_reference(
+        audio_bytes = await tts_service.synthesize_with_reference_async(
             text=request.text,
             speaker_wav=filepath,
         )
@@ -192,7 +181,7 @@ async def preview_voice(
         return Response(content=audio_bytes, media_type="audio/mpeg")
     
     except Exception as e:
-        print(f"Voice preview error: {e}")
+        log.error("Voice preview error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
 
 
@@ -208,7 +197,7 @@ async def preview_voice_get(
         raise HTTPException(status_code=404, detail="Voice not found")
     
     try:
-        audio_bytes = tts_service.synthesize_with_reference(
+        audio_bytes = await tts_service.synthesize_with_reference_async(
             text=text,
             speaker_wav=filepath,
         )
@@ -216,5 +205,5 @@ async def preview_voice_get(
         return Response(content=audio_bytes, media_type="audio/mpeg")
     
     except Exception as e:
-        print(f"Voice preview error: {e}")
+        log.error("Voice preview error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Preview failed: {str(e)}")
\ No newline at end of file
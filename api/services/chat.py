@@ -3,11 +3,12 @@
 from typing import Optional, List, Dict, Any, AsyncIterator
 from collections import OrderedDict
 import os
-import json
 
 import httpx
+import orjson
 
 from config import OLLAMA_URL, LLM_MODEL
+from log import log
 
 # ---------------------------------------------------------------------------
 # Groq config
@@ -19,6 +20,20 @@ GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
 def _use_groq() -> bool:
     return bool(GROQ_API_KEY)
 
+# ---------------------------------------------------------------------------
+# Shared HTTP client (keep-alive + HTTP/2 where the server supports it)
+# ---------------------------------------------------------------------------
+_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(120.0, read=None),
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+)
+
+
+async def close() -> None:
+    """Close the shared HTTP client (app shutdown)."""
+    await _client.aclose()
+
 # ---------------------------------------------------------------------------
 # In-memory conversation history
 # ---------------------------------------------------------------------------
@@ -69,76 +84,73 @@ _SYSTEM_PROMPT = """Ты — Спичи, весёлый и любопытный
 Ты как мультяшный персонаж — добрый, чуть смешной, всегда рад поговорить."""
 
 
+# Built once; the prompt is static so every request can share this dict
+_SYSTEM_MESSAGE: Dict[str, str] = {"role": "system", "content": _SYSTEM_PROMPT}
+
+
 def _prepare_messages(
     messages: List[Dict[str, str]],
 ) -> List[Dict[str, str]]:
-    return [{"role": "system", "content": _SYSTEM_PROMPT}] + messages
+    return [_SYSTEM_MESSAGE, *messages]
 
 
 # ---------------------------------------------------------------------------
 # Groq API call
 # ---------------------------------------------------------------------------
 
+# Static parts of every Groq request, built once; calls only add messages
+_GROQ_HEADERS = {
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json",
+}
+_GROQ_BODY: Dict[str, Any] = {
+    "model": GROQ_MODEL,
+    "max_tokens": 150,
+    "temperature": 0.7,
+    "top_p": 0.9,
+}
+
+
 async def _groq_chat(messages: List[Dict[str, str]]) -> str:
     """Call Groq API (OpenAI-compatible)."""
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    body = {
-        "model": GROQ_MODEL,
-        "messages": messages,
-        "max_tokens": 150,
-        "temperature": 0.7,
-        "top_p": 0.9,
-    }
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(GROQ_URL, headers=headers, json=body)
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+    body = {**_GROQ_BODY, "messages": messages}
+
+    response = await _client.post(
+        GROQ_URL, headers=_GROQ_HEADERS, content=orjson.dumps(body), timeout=30.0
+    )
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    return data["choices"][0]["message"]["content"]
 
 
 async def _groq_chat_stream(messages: List[Dict[str, str]]) -> AsyncIterator[bytes]:
     """Stream from Groq API."""
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    body = {
-        "model": GROQ_MODEL,
-        "messages": messages,
-        "max_tokens": 150,
-        "temperature": 0.7,
-        "top_p": 0.9,
-        "stream": True,
-    }
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        async with client.stream("POST", GROQ_URL, headers=headers, json=body) as r:
-            async for line in r.aiter_lines():
-                if not line.startswith("data: "):
-                    continue
-                payload = line[6:]
-                if payload.strip() == "[DONE]":
-                    break
-                try:
-                    chunk = json.loads(payload)
-                    delta = chunk["choices"][0].get("delta", {})
-                    content = delta.get("content", "")
-                    if content:
-                        # Emit in Ollama-compatible ndjson format so the
-                        # Flutter streaming client doesn't need changes
-                        ollama_chunk = json.dumps({
-                            "message": {"role": "assistant", "content": content},
-                            "done": False,
-                        })
-                        yield (ollama_chunk + "\n").encode()
-                except (json.JSONDecodeError, KeyError, IndexError):
-                    continue
-            # Send final done message
-            yield json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}).encode()
+    body = {**_GROQ_BODY, "messages": messages, "stream": True}
+
+    async with _client.stream(
+        "POST", GROQ_URL, headers=_GROQ_HEADERS, content=orjson.dumps(body), timeout=60.0
+    ) as r:
+        async for line in r.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            payload = line[6:]
+            if payload.strip() == "[DONE]":
+                break
+            try:
+                chunk = orjson.loads(payload)
+                delta = chunk["choices"][0].get("delta", {})
+                content = delta.get("content", "")
+                if content:
+                    # Emit in Ollama-compatible ndjson format so the
+                    # Flutter streaming client doesn't need changes
+                    yield orjson.dumps({
+                        "message": {"role": "assistant", "content": content},
+                        "done": False,
+                    }) + b"\n"
+            except (orjson.JSONDecodeError, KeyError, IndexError):
+                continue
+        # Send final done message
+        yield orjson.dumps({"message": {"role": "assistant", "content": ""}, "done": True}) + b"\n"
 
 
 # ---------------------------------------------------------------------------
@@ -153,31 +165,32 @@ _OLLAMA_OPTIONS = {
 }
 
 
+_OLLAMA_BODY: Dict[str, Any] = {"model": LLM_MODEL, "options": _OLLAMA_OPTIONS}
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
 async def _ollama_chat(messages: List[Dict[str, str]]) -> str:
-    body = {
-        "model": LLM_MODEL,
-        "stream": False,
-        "messages": messages,
-        "options": _OLLAMA_OPTIONS,
-    }
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        response = await client.post(f"{OLLAMA_URL}/api/chat", json=body)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("message", {}).get("content", "")
+    body = {**_OLLAMA_BODY, "stream": False, "messages": messages}
+    response = await _client.post(
+        f"{OLLAMA_URL}/api/chat", headers=_JSON_HEADERS, content=orjson.dumps(body), timeout=120.0
+    )
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    return data.get("message", {}).get("content", "")
 
 
 async def _ollama_chat_stream(messages: List[Dict[str, str]]) -> AsyncIterator[bytes]:
-    body = {
-        "model": LLM_MODEL,
-        "stream": True,
-        "messages": messages,
-        "options": _OLLAMA_OPTIONS,
-    }
-    async with httpx.AsyncClient(timeout=None) as client:
-        async with client.stream("POST", f"{OLLAMA_URL}/api/chat", json=body) as r:
-            async for chunk in r.aiter_bytes():
-                yield chunk
+    body = {**_OLLAMA_BODY, "stream": True, "messages": messages}
+    async with _client.stream(
+        "POST", f"{OLLAMA_URL}/api/chat", headers=_JSON_HEADERS, content=orjson.dumps(body), timeout=None
+    ) as r:
+        # Re-frame on line boundaries so every chunk sent to the client is
+        # one complete JSON event. If the client disconnects, Starlette
+        # closes this generator, which closes the upstream response and
+        # makes Ollama stop generating.
+        async for line in r.aiter_lines():
+            if line:
+                yield line.encode() + b"\n"
 
 
 # ---------------------------------------------------------------------------
@@ -214,10 +227,10 @@ async def chat_sync(
     prepared = _prepare_messages(list(history))
 
     if _use_groq():
-        print(f"[CHAT] Using Groq ({GROQ_MODEL})")
+        log.info("Chat backend: Groq (%s)", GROQ_MODEL)
         assistant_text = await _groq_chat(prepared)
     else:
-        print(f"[CHAT] Using Ollama ({LLM_MODEL})")
+        log.info("Chat backend: Ollama (%s)", LLM_MODEL)
         assistant_text = await _ollama_chat(prepared)
 
     _append_history(sid, "assistant", assistant_text)
@@ -225,24 +238,23 @@ async def chat_sync(
 
 
 async def check_connection() -> bool:
-    """Check if LLM backend is reachable."""
+    """Check if LLM backend is reachable (and warm the pooled connection)."""
     if _use_groq():
         try:
-            async with httpx.AsyncClient(timeout=5) as client:
-                r = await client.get(
-                    "https://api.groq.com/openai/v1/models",
-                    headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
-                )
-                print(f"Groq connection OK (status={r.status_code})")
-                return r.status_code == 200
+            r = await _client.get(
+                "https://api.groq.com/openai/v1/models",
+                headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+                timeout=5.0,
+            )
+            log.info("Groq connection OK (status=%s)", r.status_code)
+            return r.status_code == 200
         except Exception as e:
-            print(f"Groq connection failed: {e}")
+            log.warning("Groq connection failed: %s", e)
             return False
     else:
-        async with httpx.AsyncClient(timeout=5) as client:
-            try:
-                await client.get(f"{OLLAMA_URL}/api/tags")
-                return True
-            except Exception as e:
-                print(f"Ollama connection failed: {e}")
-                return False
\ No newline at end of file
+        try:
+            await _client.get(f"{OLLAMA_URL}/api/tags", timeout=5.0)
+            return True
+        except Exception as e:
+            log.warning("Ollama connection failed: %s", e)
+            return False
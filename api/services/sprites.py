@@ -1,23 +1,62 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+import asyncio
+import time
+import hashlib
 import io
+import os
+import re
 
-from config import MAX_SPRITE_BYTES, ALLOWED_SPRITE_FORMATS
+from PIL import Image
+
+from config import MAX_SPRITE_BYTES, ALLOWED_SPRITE_FORMATS, CDN_BASE_URL
 from services.supabase import get_supabase
+from log import log
+
 
+# Filename sanitizers (compiled once; re.sub runs in C). \w is Unicode-aware,
+# so Cyrillic names survive as they did with str.isalnum().
+_UPLOAD_NAME_STRIP = re.compile(r"[^\w.\- ]")
+_SPRITE_NAME_STRIP = re.compile(r"[^\w\-]")
+# Approved names written by approve_sprite: `<name>-<sha256[:12]><ext>`
+_HASHED_NAME = re.compile(r"-[0-9a-f]{12}\.(png|jpg|webp)$")
 
 # Supabase bucket names
 PENDING_BUCKET = "sprites-pending"
 APPROVED_BUCKET = "sprites-approved"
 
+# Listing cache TTLs (seconds); entries are also dropped on writes
+LIST_TTL = 30.0
+LIST_ALL_TTL = 10.0
+_ALL_USERS = "__all__"
+
 
 class SpriteStorage:
-    """Handle sprite file storage with pending/approved workflow using Supabase Storage."""
+    """Handle sprite file storage with pending/approved workflow using Supabase Storage.
+
+    The storage SDK is blocking, so every call runs in a worker thread via
+    asyncio.to_thread to keep the event loop free.
+    """
     
     def __init__(self):
         self.client = get_supabase()
         if not self.client:
             raise RuntimeError("Supabase not configured. Set SUPABASE_URL and SUPABASE_SECRET_KEY")
+        # (bucket, user_id) -> (expires_at, listing)
+        self._list_cache: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+    
+    def _cached(self, bucket: str, key: str) -> Optional[Any]:
+        hit = self._list_cache.get((bucket, key))
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
+        return None
+    
+    def _cache(self, bucket: str, key: str, value: Any, ttl: float) -> Any:
+        self._list_cache[(bucket, key)] = (time.monotonic() + ttl, value)
+        return value
+    
+    def _invalidate(self, bucket: str, user_id: str) -> None:
+        self._list_cache.pop((bucket, user_id), None)
+        self._list_cache.pop((bucket, _ALL_USERS), None)
     
     def _validate_image(self, content_type: str, file_size: int) -> None:
         """Validate image upload."""
@@ -41,7 +80,7 @@ class SpriteStorage:
         }
         return ext_map.get(content_type, ".png")
     
-    def save_pending(
+    async def save_pending(
         self,
         user_id: str,
         image_data: bytes,
@@ -50,36 +89,43 @@ class SpriteStorage:
     ) -> str:
         """Save kid's upload to Supabase pending bucket.
         
+        Files are keyed by a hash of their content, so resubmitting the
+        same image returns the existing filename without uploading again.
+        
         Returns:
             Filename of saved pending sprite
         """
         self._validate_image(content_type, len(image_data))
         
-        # Build storage path: user_id/filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Build storage path: user_id/<digest>_<name>
+        digest = hashlib.blake2b(image_data, digest_size=8).hexdigest()
         ext = self._get_extension(content_type)
         
         if original_filename:
-            clean_name = "".join(c for c in original_filename if c.isalnum() or c in "._- ")
-            clean_name = clean_name[:50]
-            filename = f"{timestamp}_{clean_name}"
+            clean_name = _UPLOAD_NAME_STRIP.sub("", original_filename)[:50]
+            filename = f"{digest}_{clean_name}"
             if not filename.endswith(ext):
                 filename += ext
         else:
-            filename = f"{timestamp}_sprite{ext}"
+            filename = f"{digest}_sprite{ext}"
         
-        storage_path = f"{user_id}/{filename}"
+        bucket = self.client.storage.from_(PENDING_BUCKET)
+        existing = await asyncio.to_thread(bucket.list, user_id, {"search": digest})
+        for f in existing:
+            if f.get("name", "").startswith(digest):
+                return f["name"]
         
-        # Upload to Supabase Storage
-        self.client.storage.from_(PENDING_BUCKET).upload(
-            storage_path,
+        await asyncio.to_thread(
+            bucket.upload,
+            f"{user_id}/{filename}",
             image_data,
-            file_options={"content-type": content_type}
+            file_options={"content-type": content_type},
         )
+        self._invalidate(PENDING_BUCKET, user_id)
         
         return filename
     
-    def list_pending(self, user_id: Optional[str] = None) -> Dict[str, List[str]]:
+    async def list_pending(self, user_id: Optional[str] = None) -> Dict[str, List[str]]:
         """List all pending uploads.
         
         Args:
@@ -88,24 +134,32 @@ class SpriteStorage:
         Returns:
             Dict mapping user_id to list of filenames
         """
-        result = {}
+        cached = self._cached(PENDING_BUCKET, user_id or _ALL_USERS)
+        if cached is not None:
+            return cached
+        
+        bucket = self.client.storage.from_(PENDING_BUCKET)
         
         if user_id:
             # List files in specific user folder
-            files = self.client.storage.from_(PENDING_BUCKET).list(user_id)
-            result[user_id] = [f["name"] for f in files if f.get("name")]
-        else:
-            # List all top-level folders (user IDs)
-            folders = self.client.storage.from_(PENDING_BUCKET).list()
-            for folder in folders:
-                folder_name = folder.get("name")
-                if folder_name and folder.get("id"):  # is a folder
-                    files = self.client.storage.from_(PENDING_BUCKET).list(folder_name)
-                    result[folder_name] = [f["name"] for f in files if f.get("name")]
-        
-        return result
+            files = await asyncio.to_thread(bucket.list, user_id)
+            result = {user_id: [f["name"] for f in files if f.get("name")]}
+            return self._cache(PENDING_BUCKET, user_id, result, LIST_TTL)
+        
+        # List all top-level folders (user IDs), then their files concurrently
+        folders = await asyncio.to_thread(bucket.list)
+        names = [
+            folder["name"] for folder in folders
+            if folder.get("name") and folder.get("id")  # is a folder
+        ]
+        listings = await asyncio.gather(*(asyncio.to_thread(bucket.list, name) for name in names))
+        result = {
+            name: [f["name"] for f in files if f.get("name")]
+            for name, files in zip(names, listings)
+        }
+        return self._cache(PENDING_BUCKET, _ALL_USERS, result, LIST_ALL_TTL)
     
-    def approve_sprite(
+    async def approve_sprite(
         self,
         user_id: str,
         image_data: bytes,
@@ -121,37 +175,69 @@ class SpriteStorage:
             sprite_name: Desired sprite filename (without extension)
         
         Returns:
-            Filename of approved sprite
+            Filename of approved sprite, `<name>-<content hash><ext>`. The
+            name changes whenever the image does, so URLs can be cached forever.
         """
         self._validate_image(content_type, len(image_data))
         
         # Clean sprite name
-        clean_name = "".join(c for c in sprite_name if c.isalnum() or c in "_-")
-        clean_name = clean_name[:50]
+        clean_name = _SPRITE_NAME_STRIP.sub("", sprite_name)[:50]
         
         ext = self._get_extension(content_type)
-        filename = f"{clean_name}{ext}"
+        digest = hashlib.sha256(image_data).hexdigest()[:12]
+        filename = f"{clean_name}-{digest}{ext}"
         
-        storage_path = f"{user_id}/{filename}"
-        
-        # Upload to approved bucket (upsert if exists)
-        self.client.storage.from_(APPROVED_BUCKET).upload(
-            storage_path,
+        bucket = self.client.storage.from_(APPROVED_BUCKET)
+        await asyncio.to_thread(
+            bucket.upload,
+            f"{user_id}/{filename}",
             image_data,
-            file_options={"content-type": content_type, "upsert": "true"}
+            file_options={"content-type": content_type, "upsert": "true"},
         )
         
+        # Smaller WebP variant served to clients that accept it
+        if ext != ".webp":
+            webp_data = await asyncio.to_thread(_to_webp, image_data, lossless=ext == ".png")
+            await asyncio.to_thread(
+                bucket.upload,
+                f"{user_id}/{clean_name}-{digest}.webp",
+                webp_data,
+                file_options={"content-type": "image/webp", "upsert": "true"},
+            )
+        
+        keep = {filename, f"{clean_name}-{digest}.webp"}
+        
+        # Drop earlier versions of this sprite (hashed or legacy unhashed names)
+        version = re.compile(rf"{re.escape(clean_name)}(-[0-9a-f]{{12}})?\.(png|jpg|webp)")
+        existing = await asyncio.to_thread(bucket.list, user_id)
+        stale = [
+            f"{user_id}/{f['name']}" for f in existing
+            if f.get("name") and f["name"] not in keep and version.fullmatch(f["name"])
+        ]
+        if stale:
+            await asyncio.to_thread(bucket.remove, stale)
+        self._invalidate(APPROVED_BUCKET, user_id)
+        
         return filename
     
-    def list_approved(self, user_id: str) -> List[str]:
+    async def list_approved(self, user_id: str) -> List[str]:
         """List user's approved sprites."""
+        cached = self._cached(APPROVED_BUCKET, user_id)
+        if cached is not None:
+            return cached
         try:
-            files = self.client.storage.from_(APPROVED_BUCKET).list(user_id)
-            return [f["name"] for f in files if f.get("name")]
+            files = await asyncio.to_thread(self.client.storage.from_(APPROVED_BUCKET).list, user_id)
         except Exception:
             return []
+        names = [f["name"] for f in files if f.get("name")]
+        # Hide WebP variants that sit next to their original
+        originals = {os.path.splitext(name)[0] for name in names if not name.endswith(".webp")}
+        return self._cache(APPROVED_BUCKET, user_id, [
+            name for name in names
+            if not (name.endswith(".webp") and os.path.splitext(name)[0] in originals)
+        ], LIST_TTL)
     
-    def get_sprite_url(
+    async def get_sprite_url(
         self,
         user_id: str,
         filename: str,
@@ -159,23 +245,28 @@ class SpriteStorage:
     ) -> Optional[str]:
         """Get public URL for sprite.
         
-        Returns signed URL (valid for 1 hour) or None if not found.
+        Returns the CDN URL for approved sprites when CDN_BASE_URL is set,
+        otherwise a signed URL (valid for 1 hour) or None if not found.
         """
         bucket = PENDING_BUCKET if pending else APPROVED_BUCKET
         storage_path = f"{user_id}/{filename}"
         
+        if CDN_BASE_URL and not pending:
+            return f"{CDN_BASE_URL}/{bucket}/{storage_path}"
+        
         try:
             # Create signed URL (1 hour expiry)
-            url_data = self.client.storage.from_(bucket).create_signed_url(
+            url_data = await asyncio.to_thread(
+                self.client.storage.from_(bucket).create_signed_url,
                 storage_path,
-                expires_in=3600  # 1 hour
+                expires_in=3600,  # 1 hour
             )
             return url_data.get("signedURL")
         except Exception as e:
-            print(f"Error getting sprite URL: {e}")
+            log.error("Error getting sprite URL: %s", e)
             return None
     
-    def get_sprite_bytes(
+    async def get_sprite_bytes(
         self,
         user_id: str,
         filename: str,
@@ -186,24 +277,44 @@ class SpriteStorage:
         storage_path = f"{user_id}/{filename}"
         
         try:
-            data = self.client.storage.from_(bucket).download(storage_path)
-            return data
+            return await asyncio.to_thread(self.client.storage.from_(bucket).download, storage_path)
         except Exception as e:
-            print(f"Error downloading sprite: {e}")
+            log.error("Error downloading sprite: %s", e)
             return None
     
-    def delete_pending(self, user_id: str, filename: str) -> bool:
+    async def delete_pending(self, user_id: str, filename: str) -> bool:
         """Delete a pending sprite after review."""
         storage_path = f"{user_id}/{filename}"
         
         try:
-            self.client.storage.from_(PENDING_BUCKET).remove([storage_path])
+            await asyncio.to_thread(self.client.storage.from_(PENDING_BUCKET).remove, [storage_path])
+            self._invalidate(PENDING_BUCKET, user_id)
             return True
         except Exception as e:
-            print(f"Error deleting pending sprite: {e}")
+            log.error("Error deleting pending sprite: %s", e)
             return False
 
 
+def _to_webp(image_data: bytes, lossless: bool) -> bytes:
+    """Re-encode an image as WebP (lossless for PNG drawings, q=90 otherwise)."""
+    buf = io.BytesIO()
+    with Image.open(io.BytesIO(image_data)) as img:
+        img.save(buf, format="WEBP", lossless=lossless, quality=90, method=6)
+    return buf.getvalue()
+
+
+def is_content_hashed(filename: str) -> bool:
+    """Whether an approved sprite name carries its content hash (never rewritten)."""
+    return _HASHED_NAME.search(filename) is not None
+
+
+def webp_variant(filename: str) -> Optional[str]:
+    """WebP sibling of an approved, content-hashed sprite, if it has one."""
+    if is_content_hashed(filename) and not filename.endswith(".webp"):
+        return os.path.splitext(filename)[0] + ".webp"
+    return None
+
+
 # Singleton instance
 _storage: Optional[SpriteStorage] = None
 
@@ -1,11 +1,56 @@
-import io
-from typing import Optional
+import os
+import math
+import asyncio
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Tuple, Union
 from dataclasses import dataclass
 
-from pydub import AudioSegment
-from transformers import pipeline
+from config import TORCH_THREADS
 
-from config import WHISPER_MODEL_NAME, TORCH_DEVICE
+# Pin BLAS/OpenMP pools to physical cores before numpy/torch load them, so
+# concurrent requests share cores instead of oversubscribing
+os.environ.setdefault("OMP_NUM_THREADS", str(TORCH_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(TORCH_THREADS))
+
+import numpy as np
+import torch
+
+torch.set_num_threads(TORCH_THREADS)
+torch.set_num_interop_threads(1)
+
+from faster_whisper import WhisperModel, BatchedInferencePipeline, available_models
+from faster_whisper.feature_extractor import FeatureExtractor
+from faster_whisper.transcribe import Segment, Word
+from faster_whisper.vad import VadOptions, get_speech_timestamps, get_vad_model, merge_segments
+
+from config import (
+    WHISPER_MODEL_NAME,
+    WHISPER_COMPUTE,
+    WHISPER_CT2_DIR,
+    WHISPER_BACKEND,
+    WHISPER_ONNX_DIR,
+    WHISPER_FLASH_ATTENTION,
+    TORCH_DEVICE,
+    STT_MAX_BATCH,
+    STT_MAX_WAIT_MS,
+    STT_VAD,
+)
+from utils import decode_to_mono
+from log import log
+import buffer_pool
+
+SAMPLE_RATE = 16000
+WINDOW_SAMPLES = 30 * SAMPLE_RATE  # Whisper's fixed encoder window
+MIN_SPEECH_SAMPLES = int(0.3 * SAMPLE_RATE)  # less voiced audio than this is treated as silence
+
+# Silero VAD settings for kids' turns: short pauses still split speech
+_VAD_OPTIONS = VadOptions(
+    onset=0.4,
+    min_speech_duration_ms=200,
+    min_silence_duration_ms=300,
+    max_speech_duration_s=WINDOW_SAMPLES / SAMPLE_RATE,
+)
 
 
 @dataclass
@@ -20,21 +65,354 @@ class TranscriptionResult:
 
 
 _model = None
+_pipeline: Optional[BatchedInferencePipeline] = None
+_onnx = None  # (ORTModelForSpeechSeq2Seq, WhisperProcessor) when WHISPER_BACKEND == "onnx"
+
+# Model calls run here rather than in the default pool shared with TTS;
+# one worker since each batch already uses all TORCH_THREADS
+_stt_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt")
+
+
+def _resolve_model_path(name: str) -> str:
+    """Return something WhisperModel can load.
+
+    Stock sizes and local CTranslate2 directories are used as-is. Any other
+    name is treated as a HuggingFace transformers checkpoint and converted
+    once into WHISPER_CT2_DIR.
+    """
+    if name in available_models() or os.path.isdir(name):
+        return name
 
+    output_dir = os.path.join(WHISPER_CT2_DIR, name.replace("/", "--"))
+    if not os.path.exists(os.path.join(output_dir, "model.bin")):
+        from ctranslate2.converters import TransformersConverter
 
-def get_model():
+        log.info("Converting %s to CTranslate2 format", name)
+        TransformersConverter(name).convert(output_dir, quantization=WHISPER_COMPUTE, force=True)
+    return output_dir
+
+
+class _CudaFeatureExtractor(FeatureExtractor):
+    """Whisper log-mel frontend computed with torch.stft on the GPU.
+
+    Same padding, window, mel filters and normalization as faster-whisper's
+    NumPy extractor; the FFT and mel matmul run on cuFFT/cuBLAS and only the
+    (smaller) features are copied back for CTranslate2.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._window = torch.hann_window(self.n_fft, device="cuda")
+        self._mel_filters = torch.from_numpy(self.mel_filters).to("cuda")
+
+    def __call__(self, waveform: np.ndarray, padding=160, chunk_length=None):
+        if chunk_length is not None:
+            self.n_samples = chunk_length * self.sampling_rate
+            self.nb_max_frames = self.n_samples // self.hop_length
+
+        with torch.inference_mode():
+            audio = torch.from_numpy(np.ascontiguousarray(waveform, dtype=np.float32))
+            audio = audio.to("cuda", non_blocking=True)
+            if padding:
+                audio = torch.nn.functional.pad(audio, (0, padding))
+            stft = torch.stft(
+                audio, self.n_fft, self.hop_length, window=self._window, return_complex=True
+            )
+            magnitudes = stft[..., :-1].abs() ** 2
+            log_spec = torch.clamp(self._mel_filters @ magnitudes, min=1e-10).log10()
+            log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+            log_spec = (log_spec + 4.0) / 4.0
+            return log_spec.cpu().numpy()
+
+
+def get_model() -> WhisperModel:
     """Get STT model (lazy-loaded singleton)."""
     global _model
     if _model is None:
-        print(f"Loading STT model: {WHISPER_MODEL_NAME}")
-        _model = pipeline(
-            "automatic-speech-recognition",
-            model=WHISPER_MODEL_NAME,
-            device=0 if TORCH_DEVICE == "cuda" else -1,
-        )
+        log.debug("Loading STT model: %s (%s)", WHISPER_MODEL_NAME, WHISPER_COMPUTE)
+        if TORCH_DEVICE == "cuda":
+            # int8 weights, fp16 activations + CT2 flash attention when available
+            model_path = _resolve_model_path(WHISPER_MODEL_NAME)
+            # num_workers stays 1: every call comes through the one-thread _stt_pool
+            kwargs = dict(device="cuda", device_index=0, compute_type=WHISPER_COMPUTE)
+            try:
+                _model = WhisperModel(model_path, flash_attention=WHISPER_FLASH_ATTENTION, **kwargs)
+            except (RuntimeError, ValueError) as e:
+                if not WHISPER_FLASH_ATTENTION:
+                    raise
+                log.warning("Flash attention unavailable (%s), loading STT model without it", e)
+                _model = WhisperModel(model_path, flash_attention=False, **kwargs)
+            _model.feature_extractor = _CudaFeatureExtractor(**_model.feat_kwargs)
+        else:
+            _model = WhisperModel(
+                _resolve_model_path(WHISPER_MODEL_NAME),
+                device="cpu",
+                compute_type=WHISPER_COMPUTE,
+                cpu_threads=TORCH_THREADS,
+            )
     return _model
 
 
+def get_pipeline() -> BatchedInferencePipeline:
+    """Get batched inference pipeline around the STT model (singleton)."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = BatchedInferencePipeline(model=get_model())
+    return _pipeline
+
+
+def _get_onnx():
+    """Load the ONNX Runtime Whisper export (lazy singleton).
+
+    Prefers the OpenVINO EP (VNNI/AMX int8 on Intel) or QNN EP (Snapdragon)
+    when the installed onnxruntime build provides them. Requires
+    optimum[onnxruntime]; see scripts/export_whisper_onnx.py.
+    """
+    global _onnx
+    if _onnx is None:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import WhisperProcessor
+
+        available = onnxruntime.get_available_providers()
+        provider = next(
+            (p for p in ("OpenVINOExecutionProvider", "QNNExecutionProvider") if p in available),
+            "CPUExecutionProvider",
+        )
+        log.debug("Loading ONNX STT model: %s (%s)", WHISPER_ONNX_DIR, provider)
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(
+            WHISPER_ONNX_DIR, use_merged=False, provider=provider
+        )
+        _onnx = (model, WhisperProcessor.from_pretrained(WHISPER_ONNX_DIR))
+    return _onnx
+
+
+def _transcribe_batch_onnx(audios: List[np.ndarray], language: str) -> List[List[Segment]]:
+    """Transcribe a batch with the ONNX Runtime backend.
+
+    Inputs are padded/trimmed to one 30s window each. There are no word
+    timestamps; word probabilities are the mean probability of the BPE
+    tokens making up each word, which is all the metrics need.
+    """
+    model, processor = _get_onnx()
+    tokenizer = processor.tokenizer
+    special_ids = set(tokenizer.all_special_ids)
+
+    features = processor.feature_extractor(
+        audios, sampling_rate=SAMPLE_RATE, return_tensors="np"
+    ).input_features
+    out = model.generate(
+        torch.from_numpy(features),
+        language=language,
+        task="transcribe",
+        return_dict_in_generate=True,
+        output_scores=True,
+    )
+    logprobs = model.compute_transition_scores(out.sequences, out.scores, normalize_logits=True)
+
+    results = []
+    for sequence, token_logprobs in zip(out.sequences, logprobs):
+        generated = sequence[-token_logprobs.shape[0]:].tolist()
+        words: List[List] = []
+        for token, logprob in zip(generated, token_logprobs.tolist()):
+            if token in special_ids:
+                continue
+            piece = tokenizer.convert_ids_to_tokens(token)
+            if not words or piece.startswith("Ġ"):
+                words.append([[], []])
+            words[-1][0].append(token)
+            words[-1][1].append(math.exp(logprob))
+
+        tokens = [t for word_tokens, _ in words for t in word_tokens]
+        probs = [p for _, word_probs in words for p in word_probs]
+        results.append([
+            Segment(
+                id=1,
+                seek=0,
+                start=0.0,
+                end=0.0,
+                text=tokenizer.decode(tokens),
+                tokens=tokens,
+                avg_logprob=sum(math.log(p) for p in probs) / len(probs) if probs else 0.0,
+                compression_ratio=0.0,
+                no_speech_prob=0.0,
+                words=[
+                    Word(
+                        start=0.0,
+                        end=0.0,
+                        word=tokenizer.decode(word_tokens),
+                        probability=sum(word_probs) / len(word_probs),
+                    )
+                    for word_tokens, word_probs in words
+                ],
+                temperature=0.0,
+            )
+        ] if tokens else [])
+    return results
+
+
+def _transcribe_batch(audios: List[np.ndarray], language: str) -> List[List[Segment]]:
+    """Transcribe a batch, skipping the model for utterances without speech."""
+    results: List[List[Segment]] = [[] for _ in audios]
+    clips = [_speech_clips(audio) for audio in audios]
+    voiced = [i for i, audio_clips in enumerate(clips) if audio_clips]
+    if not voiced:
+        return results
+
+    voiced_audios = [audios[i] for i in voiced]
+    if WHISPER_BACKEND == "onnx":
+        outputs = _transcribe_batch_onnx(voiced_audios, language)
+    else:
+        outputs = _transcribe_batch_ct2(voiced_audios, language, [clips[i] for i in voiced])
+    for i, segments in zip(voiced, outputs):
+        results[i] = segments
+    return results
+
+
+def _speech_clips(audio: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) sample ranges to transcribe, each at most one window.
+
+    With STT_VAD, silence is dropped by Silero VAD so it never reaches the
+    encoder, and audio with under MIN_SPEECH_SAMPLES of speech yields no
+    clips at all; otherwise the audio is cut into plain 30s windows.
+    """
+    if STT_VAD:
+        speech = get_speech_timestamps(audio, _VAD_OPTIONS, sampling_rate=SAMPLE_RATE)
+        if sum(chunk["end"] - chunk["start"] for chunk in speech) < MIN_SPEECH_SAMPLES:
+            return []
+        return [
+            (chunk["start"], chunk["end"])
+            for chunk in merge_segments(speech, _VAD_OPTIONS, sampling_rate=SAMPLE_RATE)
+        ]
+    return [
+        (start, min(start + WINDOW_SAMPLES, len(audio)))
+        for start in range(0, len(audio), WINDOW_SAMPLES)
+    ]
+
+
+def _transcribe_batch_ct2(
+    audios: List[np.ndarray],
+    language: str,
+    speech_clips: List[List[Tuple[int, int]]],
+) -> List[List[Segment]]:
+    """Transcribe several utterances in one batched encoder pass.
+
+    Each utterance is laid out on its own 30s window boundary in a single
+    buffer and its speech regions are passed as clip timestamps, so every
+    clip becomes one row of the batch. Segments are mapped back to their
+    utterance by start time and their timestamps made relative to it.
+    """
+    offsets = []
+    clips = []
+    total = 0
+    for audio, audio_clips in zip(audios, speech_clips):
+        offsets.append(total)
+        for start, end in audio_clips:
+            clips.append({"start": total + start, "end": total + end})
+        windows = max(1, -(-len(audio) // WINDOW_SAMPLES))
+        total += windows * WINDOW_SAMPLES
+
+    results: List[List[Segment]] = [[] for _ in audios]
+    if not clips:
+        return results
+
+    buf = buffer_pool.acquire_f32(total)
+    try:
+        merged = buf[:total]
+        merged.fill(0.0)
+        for offset, audio in zip(offsets, audios):
+            merged[offset:offset + len(audio)] = audio
+
+        pipeline = get_pipeline()
+        pipeline.last_speech_timestamp = 0.0  # word timing state leaks between calls
+        segments, _ = pipeline.transcribe(
+            merged,
+            language=language,
+            beam_size=1,  # greedy
+            word_timestamps=True,
+            vad_filter=False,
+            clip_timestamps=clips,
+            batch_size=len(clips),
+        )
+
+        offset_seconds = [offset / SAMPLE_RATE for offset in offsets]
+        for segment in segments:
+            idx = max(bisect.bisect_right(offset_seconds, segment.start) - 1, 0)
+            # Rebase timestamps from the shared buffer onto the utterance
+            shift = offset_seconds[idx]
+            if shift:
+                segment.start -= shift
+                segment.end -= shift
+                for word in segment.words or ():
+                    word.start -= shift
+                    word.end -= shift
+            results[idx].append(segment)
+    finally:
+        buffer_pool.release_f32(buf)
+    return results
+
+
+class _Batcher:
+    """Coalesce concurrent transcription requests into batched model calls.
+
+    Requests are queued with a future; a single worker drains up to
+    STT_MAX_BATCH items (waiting at most STT_MAX_WAIT_MS for stragglers),
+    runs them per language on the STT executor thread, and resolves each future.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, audio: np.ndarray, language: str) -> List[Segment]:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, language, future))
+        return await future
+
+    async def _drain(self) -> List[Tuple[np.ndarray, str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._drain()
+            by_language = {}
+            for item in batch:
+                by_language.setdefault(item[1], []).append(item)
+
+            for language, items in by_language.items():
+                try:
+                    outputs = await asyncio.get_running_loop().run_in_executor(
+                        _stt_pool, _transcribe_batch, [audio for audio, _, _ in items], language
+                    )
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), segments in zip(items, outputs):
+                    if not future.done():
+                        future.set_result(segments)
+
+
+_batcher = _Batcher(STT_MAX_BATCH, STT_MAX_WAIT_MS / 1000)
+
+
 def _calculate_clarity_level(confidence: float) -> str:
     """Determine clarity level from confidence score."""
     if confidence >= 0.75:
@@ -44,55 +422,60 @@ def _calculate_clarity_level(confidence: float) -> str:
     return "low"
 
 
-def transcribe(
-    audio_bytes: bytes,
+def decode(
+    audio_bytes: Union[bytes, bytearray],
     audio_format: Optional[str] = None,
+) -> np.ndarray:
+    """Decode an upload to mono 16kHz float32 samples.
+    
+    Raises:
+        ValueError: If the audio cannot be decoded
+    """
+    try:
+        return decode_to_mono(audio_bytes, SAMPLE_RATE, audio_format)
+    except Exception as e:
+        raise ValueError(f"Could not decode audio: {e}")
+
+
+async def transcribe(
+    samples: np.ndarray,
     language: str = "ru",
 ) -> TranscriptionResult:
     """Transcribe audio to text with confidence metrics.
     
     Args:
-        audio_bytes: Raw audio bytes
-        audio_format: Audio format hint (wav, mp3, etc.)
+        samples: Mono 16kHz float32 samples (see decode())
         language: Target language code
     
     Returns:
         TranscriptionResult with text and metrics
     """
-    # Decode audio
-    try:
-        if audio_format:
-            audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format=audio_format)
-        else:
-            audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    except Exception as e:
-        raise ValueError(f"Could not decode audio: {e}")
+    duration_seconds = samples.shape[0] / SAMPLE_RATE
     
-    # Normalize for Whisper: mono, 16kHz
-    audio = audio.set_channels(1).set_frame_rate(16000)
-    duration_seconds = audio.duration_seconds
+    # Transcribe alongside any other in-flight requests
+    segments = await _batcher.submit(samples, language)
+    if not segments:
+        # Silent/too-short audio never reached the model
+        return TranscriptionResult(
+            text="",
+            duration=duration_seconds,
+            language=language,
+            avg_confidence=0.0,
+            wpm=0.0,
+            word_count=0,
+            clarity_level="low",
+        )
     
-    # Export to WAV for pipeline
-    buf = io.BytesIO()
-    audio.export(buf, format="wav")
-    buf.seek(0)
+    text = "".join(segment.text for segment in segments).strip()
+    word_count = sum(len(segment.words or ()) for segment in segments)
     
-    # Transcribe
-    model = get_model()
-    result = model(
-        buf.read(),
-        return_timestamps="word",
-        generate_kwargs={"language": language},
+    # Single vectorized reduction over all word probabilities
+    confidences = np.fromiter(
+        (word.probability for segment in segments for word in segment.words or ()),
+        dtype=np.float32,
+        count=word_count,
     )
-    
-    text = result["text"].strip()
-    chunks = result.get("chunks", [])
-    
-    # Extract confidence scores
-    confidences = [chunk["score"] for chunk in chunks if "score" in chunk]
-    word_count = len(chunks)
-    
-    avg_confidence = sum(confidences) / len(confidences) if confidences else 0.5
+    avg_confidence = float(confidences.mean()) if confidences.size else 0.5
     wpm = (word_count / duration_seconds * 60) if duration_seconds > 0 else 0
     
     return TranscriptionResult(
@@ -109,7 +492,15 @@ def transcribe(
 def warmup() -> None:
     """Warm up STT model."""
     try:
-        _ = get_model()
-        print("STT warmup complete")
+        if WHISPER_BACKEND == "onnx":
+            _ = _get_onnx()
+        else:
+            _ = get_pipeline()
+            if STT_VAD:
+                get_vad_model()  # cached; avoids loading Silero on the first request
+        # One buffer per common case: a lone utterance and a full batch
+        buffer_pool.reserve_f32(WINDOW_SAMPLES)
+        buffer_pool.reserve_f32(STT_MAX_BATCH * WINDOW_SAMPLES)
+        log.info("STT warmup complete")
     except Exception as e:
-        print(f"STT warmup failed: {e}")
\ No newline at end of file
+        log.error("STT warmup failed: %s", e, exc_info=True)
\ No newline at end of file
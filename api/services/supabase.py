@@ -1,19 +1,70 @@
-from typing import Optional
-from supabase import create_client, Client
+from typing import Optional, TYPE_CHECKING
+from urllib.parse import quote
+
+import httpx
 
 from config import SUPABASE_URL, SUPABASE_SECRET_KEY
 
-_client: Optional[Client] = None
+if TYPE_CHECKING:
+    from supabase import Client
+
+_client: Optional["Client"] = None
+_admin_http: Optional[httpx.AsyncClient] = None
+
 
+def get_supabase() -> Optional["Client"]:
+    """Get Supabase client (singleton).
 
-def get_supabase() -> Optional[Client]:
-    """Get Supabase client (singleton)."""
+    The supabase package (postgrest, gotrue, storage, realtime) is imported
+    on first use rather than at module import, keeping it out of cold start
+    and skipping it entirely when Supabase isn't configured.
+    """
     global _client
     if _client is None and SUPABASE_URL and SUPABASE_SECRET_KEY:
+        from supabase import create_client
+
         _client = create_client(SUPABASE_URL, SUPABASE_SECRET_KEY)
     return _client
 
 
 def is_configured() -> bool:
     """Check if Supabase is configured."""
-    return bool(SUPABASE_URL and SUPABASE_SECRET_KEY)
\ No newline at end of file
+    return bool(SUPABASE_URL and SUPABASE_SECRET_KEY)
+
+
+def _get_admin_http() -> httpx.AsyncClient:
+    """Pooled async client for the GoTrue admin API (created on first use)."""
+    global _admin_http
+    if _admin_http is None:
+        _admin_http = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/auth/v1",
+            headers={
+                "apikey": SUPABASE_SECRET_KEY,
+                "Authorization": f"Bearer {SUPABASE_SECRET_KEY}",
+            },
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+    return _admin_http
+
+
+async def delete_user(user_id: str) -> bool:
+    """Delete an auth user via the admin API without blocking the event loop.
+
+    Returns:
+        False if the user doesn't exist, True once deleted
+
+    Raises:
+        httpx.HTTPStatusError: On any other non-2xx response
+    """
+    response = await _get_admin_http().delete(f"/admin/users/{quote(user_id, safe='')}")
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    return True
+
+
+async def close() -> None:
+    """Close the admin HTTP client (app shutdown)."""
+    if _admin_http is not None:
+        await _admin_http.aclose()
@@ -1,16 +1,61 @@
-import io
 import os
-from typing import Optional, List
-
-import soundfile as sf
-from pydub import AudioSegment
+import time
+import hashlib
+import asyncio
+import contextlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple, FrozenSet, Union, Iterator, AsyncIterator, Callable
+
+import numpy as np
+import torch
 from TTS.api import TTS
-
-from config import XTTS_LANG
+from TTS.tts.models import xtts as _xtts_module
+
+from config import (
+    XTTS_LANG,
+    TORCH_DEVICE,
+    XTTS_COMPILE,
+    XTTS_AUTOCAST,
+    XTTS_DTYPE,
+    XTTS_VOCODER,
+    XTTS_VOCODER_ONNX,
+    TTS_MAX_BATCH,
+    TTS_MAX_WAIT_MS,
+    TTS_CACHE_MB,
+)
+from utils import encode_mp3, encode_wav, to_pcm16, Mp3StreamEncoder
+from log import log
 
 _model: Optional[TTS] = None
 SAMPLE_RATE = 24000
 
+# (gpt_cond_latent, speaker_embedding) per built-in speaker, already on device
+_speaker_latents: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+_valid_speakers: Optional[FrozenSet[str]] = None
+_fallback_speaker: Optional[str] = None
+
+# Conditioning latents for reference wavs (custom/user voices), keyed by
+# (path, mtime) so a re-uploaded voice is recomputed
+MAX_REFERENCE_LATENTS = 64
+_reference_latents: "OrderedDict[Tuple[str, float], Tuple[torch.Tensor, torch.Tensor]]" = OrderedDict()
+
+# Latents for the bundled CUSTOM_VOICES by name. Those files ship with the
+# image and never change, so lookups skip the exists/mtime checks.
+_custom_latents: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+
+# Encoded outputs of repeated (text, voice, lang, format) requests, LRU by
+# total size. Only built-in/bundled voices are cached: a user's voice can be
+# re-recorded under the same name.
+MAX_OUTPUT_CACHE_BYTES = TTS_CACHE_MB * 1024 * 1024
+_output_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_output_cache_bytes = 0
+
+# XTTS runs one utterance at a time; keep it off the event loop and the
+# default pool on its own worker thread
+_tts_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+
 # Voice configuration
 VOICES_DIR = os.path.join(os.path.dirname(__file__), "..", "voices")
 USER_VOICES_DIR = os.path.join(VOICES_DIR, "users")
@@ -19,25 +64,192 @@ DEFAULT_SPEAKER = "Claribel Dervla"
 CUSTOM_VOICES = {
     "Aiym": "aiym.wav",
 }
+_SPEAKERS = ("default", *CUSTOM_VOICES)
 
 os.makedirs(USER_VOICES_DIR, exist_ok=True)
 
 
+class _Float32Output(torch.nn.Module):
+    """Cast a submodule's output back to fp32.
+
+    Under CPU autocast the HiFi-GAN decoder returns bf16, which XTTS then
+    calls .numpy() on (unsupported for bf16). Attribute access falls
+    through to the wrapped module so e.g. `speaker_encoder` still works.
+    """
+
+    def __init__(self, module: torch.nn.Module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, *args, **kwargs):
+        return self.module(*args, **kwargs).float()
+
+    def __getattr__(self, name: str):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.module, name)
+
+
+# TensorRT optimization profile for the vocoder's dynamic latent length.
+# XTTS caps GPT output at gpt_max_audio_tokens (605) mel frames per sentence
+# and the stream path decodes a growing prefix of that, so one profile spans
+# every call without engine rebuilds; the max leaves headroom for speed < 1.
+_TRT_LATENT_FRAMES = {"min": 1, "opt": 256, "max": 1024}
+
+
+def _trt_profile_shapes(frames: int) -> str:
+    return f"latents:1x{frames}x1024,g:1x512x1"
+
+
+class _OnnxVocoder(torch.nn.Module):
+    """HiFi-GAN waveform decoder running on ONNX Runtime.
+
+    Stands in for xtts.hifigan_decoder. Attribute access (e.g. the
+    `speaker_encoder` used for reference latents) falls through to the
+    original PyTorch module. Prefers TensorRT in fp16 with a cached engine,
+    then CUDA, then CPU; see scripts/export_xtts_onnx.py.
+    """
+
+    def __init__(self, module: torch.nn.Module, path: str):
+        super().__init__()
+        self.module = module
+        import onnxruntime
+
+        available = onnxruntime.get_available_providers()
+        providers: List[Union[str, Tuple[str, Dict]]] = []
+        if "TensorrtExecutionProvider" in available:
+            providers.append(("TensorrtExecutionProvider", {
+                "trt_fp16_enable": True,
+                "trt_engine_cache_enable": True,
+                "trt_engine_cache_path": os.path.dirname(os.path.abspath(path)),
+                "trt_profile_min_shapes": _trt_profile_shapes(_TRT_LATENT_FRAMES["min"]),
+                "trt_profile_opt_shapes": _trt_profile_shapes(_TRT_LATENT_FRAMES["opt"]),
+                "trt_profile_max_shapes": _trt_profile_shapes(_TRT_LATENT_FRAMES["max"]),
+            }))
+        if "CUDAExecutionProvider" in available:
+            providers.append("CUDAExecutionProvider")
+        providers.append("CPUExecutionProvider")
+        self._session = onnxruntime.InferenceSession(path, providers=providers)
+        log.info("XTTS vocoder on ONNX Runtime: %s (%s)", path, self._session.get_providers()[0])
+
+    def forward(self, latents: torch.Tensor, g: torch.Tensor) -> torch.Tensor:
+        (wav,) = self._session.run(None, {
+            "latents": latents.float().cpu().numpy(),
+            "g": g.float().cpu().numpy(),
+        })
+        return torch.from_numpy(wav).to(latents.device)
+
+    def __getattr__(self, name: str):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.module, name)
+
+
+_GPT_DTYPE: Optional[torch.dtype] = {"fp16": torch.float16, "bf16": torch.bfloat16}.get(XTTS_DTYPE)
+_USE_AUTOCAST = (XTTS_AUTOCAST or _GPT_DTYPE is not None) and XTTS_DTYPE != "int8"
+
+
+def _quantize_int8(gpt: torch.nn.Module) -> torch.nn.Module:
+    """Dynamic int8 quantization of the GPT's projection layers (CPU).
+
+    HF GPT-2 blocks use transformers' Conv1D (a Linear with transposed
+    weights) for attention and MLP, which quantize_dynamic does not know;
+    they are swapped for equivalent nn.Linear layers first.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(gpt.modules()):
+        for name, child in parent.named_children():
+            if isinstance(child, Conv1D):
+                nx, nf = child.weight.shape
+                linear = torch.nn.Linear(nx, nf)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return torch.ao.quantization.quantize_dynamic(gpt, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+_load_fsspec = _xtts_module.load_fsspec
+
+
+def _load_checkpoint_mmap(path: str, map_location=None, **kwargs):
+    """Memory-map local XTTS checkpoints instead of reading them into memory.
+
+    TTS's load_fsspec hands torch.load an open file object, which always
+    copies the whole file into user space. Loading by path with mmap=True
+    maps it instead, so tensors are backed by the page cache (shared
+    across restarts and processes). Remote or legacy-format files fall
+    back to the stock loader.
+    """
+    if os.path.isfile(path):
+        try:
+            return torch.load(path, map_location=map_location, mmap=True, **kwargs)
+        except RuntimeError as e:
+            log.warning("mmap load failed for %s (%s), reading it instead", path, e)
+    return _load_fsspec(path, map_location=map_location, **kwargs)
+
+
 def get_model() -> TTS:
     global _model
     if _model is None:
-        _model = TTS("tts_models/multilingual/multi-dataset/xtts_v2")
+        if TORCH_DEVICE == "cuda":
+            # TF32 tensor cores for the parts left in fp32 (HiFi-GAN, speaker encoder)
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        _xtts_module.load_fsspec = _load_checkpoint_mmap
+        model = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(TORCH_DEVICE)
+        xtts = model.synthesizer.tts_model
+        # Lower-precision weights cut bandwidth for the autoregressive
+        # decoder; the HiFi-GAN decoder and speaker encoder stay fp32
+        if _GPT_DTYPE is not None:
+            xtts.gpt.to(_GPT_DTYPE)
+        elif XTTS_DTYPE == "int8":
+            xtts.gpt = _quantize_int8(xtts.gpt)
+        if XTTS_COMPILE:
+            # Compile the transformer the token-by-token decode loop calls
+            # (gpt.generate / get_generator go through gpt_inference, not
+            # GPT.forward). The sequence and KV cache grow every step, so
+            # shapes are dynamic rather than recorded CUDA graphs per length.
+            # Compiled lazily on first call; warmup() pays that cost
+            gpt_inference = xtts.gpt.gpt_inference
+            gpt_inference.transformer = torch.compile(gpt_inference.transformer, dynamic=True)
+        if XTTS_VOCODER == "onnx":
+            # ORT returns fp32 whatever the GPT latents' dtype
+            xtts.hifigan_decoder = _OnnxVocoder(xtts.hifigan_decoder, XTTS_VOCODER_ONNX)
+        else:
+            if XTTS_COMPILE:
+                xtts.hifigan_decoder = torch.compile(xtts.hifigan_decoder)
+            if _USE_AUTOCAST:
+                xtts.hifigan_decoder = _Float32Output(xtts.hifigan_decoder)
+        _model = model
     return _model
 
 
-def _get_valid_speakers() -> List[str]:
-    try:
-        model = get_model()
-        if hasattr(model, "speakers") and model.speakers:
-            return model.speakers
-    except Exception:
-        pass
-    return []
+def _autocast():
+    """bf16 on CPU, fp16 on CUDA (or the GPT dtype), or a no-op when disabled.
+
+    Always on with fp16/bf16 GPT weights, so fp32 inputs meet them; always
+    off with int8, whose quantized Linear layers only take fp32 input.
+    """
+    if not _USE_AUTOCAST:
+        return contextlib.nullcontext()
+    dtype = _GPT_DTYPE or (torch.bfloat16 if TORCH_DEVICE == "cpu" else torch.float16)
+    return torch.autocast(device_type=TORCH_DEVICE, dtype=dtype)
+
+
+def _get_valid_speakers() -> FrozenSet[str]:
+    """Built-in speaker names, computed once after the model loads."""
+    global _valid_speakers, _fallback_speaker
+    if _valid_speakers is None:
+        try:
+            speakers = list(get_model().speakers or [])
+        except Exception:
+            return frozenset()
+        _valid_speakers = frozenset(speakers)
+        _fallback_speaker = speakers[0] if speakers else None
+    return _valid_speakers
 
 
 def _validate_speaker(speaker: str) -> str:
@@ -46,19 +258,92 @@ def _validate_speaker(speaker: str) -> str:
         return speaker
     if speaker in valid:
         return speaker
-    print(f"[TTS WARNING] Speaker '{speaker}' not in model. "
-          f"Falling back to '{DEFAULT_SPEAKER}'")
+    log.warning("Speaker '%s' not in model. Falling back to '%s'", speaker, DEFAULT_SPEAKER)
     if DEFAULT_SPEAKER in valid:
         return DEFAULT_SPEAKER
-    fallback = valid[0]
-    print(f"[TTS WARNING] DEFAULT_SPEAKER also invalid, using '{fallback}'")
-    return fallback
+    log.warning("DEFAULT_SPEAKER also invalid, using '%s'", _fallback_speaker)
+    return _fallback_speaker
+
+
+def _gpt_latent(latent: torch.Tensor) -> torch.Tensor:
+    """Cast a cached gpt_cond_latent to the GPT's weight dtype."""
+    return latent.to(_GPT_DTYPE) if _GPT_DTYPE is not None else latent
+
+
+def _get_speaker_latents(speaker: str) -> Tuple[torch.Tensor, torch.Tensor]:
+    latents = _speaker_latents.get(speaker)
+    if latents is None:
+        xtts = get_model().synthesizer.tts_model
+        stored = xtts.speaker_manager.speakers[speaker]
+        latents = (
+            _gpt_latent(stored["gpt_cond_latent"].to(xtts.device)),
+            stored["speaker_embedding"].to(xtts.device),
+        )
+        _speaker_latents[speaker] = latents
+    return latents
+
+
+def _inference(
+    text: str,
+    lang: str,
+    latents: Tuple[torch.Tensor, torch.Tensor],
+) -> np.ndarray:
+    """Run XTTS directly with precomputed conditioning latents.
+
+    Skips TTS.tts(), which re-resolves the speaker and goes through the
+    generic synthesizer wrapper on every call.
+    """
+    xtts = get_model().synthesizer.tts_model
+    config = xtts.config
+    gpt_cond_latent, speaker_embedding = latents
+    with torch.inference_mode(), _autocast():
+        out = xtts.inference(
+            text,
+            lang,
+            gpt_cond_latent,
+            speaker_embedding,
+            temperature=config.temperature,
+            length_penalty=config.length_penalty,
+            repetition_penalty=config.repetition_penalty,
+            top_k=config.top_k,
+            top_p=config.top_p,
+            enable_text_splitting=True,
+        )
+    return out["wav"]
+
+
+def _get_reference_latents(path: str) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Conditioning latents for a reference wav, computed once per file version.
+
+    tts.tts(speaker_wav=...) re-runs the conditioning encoder on every call;
+    caching the latents lets reference voices go through _inference().
+    """
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    latents = _reference_latents.get(key)
+    if latents is not None:
+        _reference_latents.move_to_end(key)
+        return latents
+
+    xtts = get_model().synthesizer.tts_model
+    config = xtts.config
+    with torch.inference_mode(), _autocast():
+        gpt_cond_latent, speaker_embedding = xtts.get_conditioning_latents(
+            audio_path=path,
+            gpt_cond_len=config.gpt_cond_len,
+            gpt_cond_chunk_len=config.gpt_cond_chunk_len,
+            max_ref_length=config.max_ref_len,
+            sound_norm_refs=config.sound_norm_refs,
+        )
+    latents = (_gpt_latent(gpt_cond_latent), speaker_embedding.float())
+    _reference_latents[key] = latents
+    if len(_reference_latents) > MAX_REFERENCE_LATENTS:
+        _reference_latents.popitem(last=False)
+    return latents
 
 
 def list_speakers() -> List[str]:
-    voices = ["default"]
-    voices.extend(CUSTOM_VOICES.keys())
-    return voices
+    """Speaker names for /speakers; a fresh list so callers can't mutate _SPEAKERS."""
+    return list(_SPEAKERS)
 
 
 def get_user_voice_path(user_id: str, voice_id: str) -> Optional[str]:
@@ -78,25 +363,26 @@ def get_user_default_voice_path(user_id: str) -> Optional[str]:
 
 
 def _wav_to_bytes(wav: list, output_format: str = "mp3") -> bytes:
-    buf = io.BytesIO()
-    sf.write(buf, wav, samplerate=SAMPLE_RATE, format="WAV", subtype="PCM_16")
-    wav_bytes = buf.getvalue()
+    """Encode XTTS output in a single pass.
 
-    if not wav_bytes or len(wav_bytes) < 100:
-        print("[TTS WARNING] Generated WAV is empty or suspiciously small")
+    The float32 samples go straight into the encoder (libmp3lame via PyAV,
+    or int16 WAV); there is no intermediate WAV decode or ffmpeg process.
+    """
+    samples = np.asarray(wav, dtype=np.float32)
 
-    if output_format == "wav":
-        return wav_bytes
+    if samples.size < 32:
+        log.warning("Generated audio is empty or suspiciously short")
 
-    audio = AudioSegment.from_file(io.BytesIO(wav_bytes), format="wav")
-    audio = audio.set_frame_rate(SAMPLE_RATE)
+    if output_format == "wav":
+        return encode_wav(samples, SAMPLE_RATE)
 
-    if audio.dBFS < -50:
-        print(f"[TTS WARNING] Output audio is near-silent (dBFS={audio.dBFS:.1f})")
+    # dot() reduces without materializing a squared copy of the signal
+    rms = float(np.sqrt(np.dot(samples, samples) / samples.size)) if samples.size else 0.0
+    dbfs = 20 * np.log10(rms) if rms > 0 else float("-inf")
+    if dbfs < -50:
+        log.warning("Output audio is near-silent (dBFS=%.1f)", dbfs)
 
-    out = io.BytesIO()
-    audio.export(out, format="mp3", parameters=["-q:a", "3", "-ar", str(SAMPLE_RATE)])
-    return out.getvalue()
+    return encode_mp3(samples, SAMPLE_RATE)
 
 
 def synthesize_with_reference(
@@ -107,57 +393,388 @@ def synthesize_with_reference(
 ) -> bytes:
     if not os.path.exists(speaker_wav):
         raise FileNotFoundError(f"Reference audio not found: {speaker_wav}")
-    tts = get_model()
-    wav = tts.tts(text=text, language=lang, speaker_wav=speaker_wav)
+    wav = _inference(text, lang, _get_reference_latents(speaker_wav))
     return _wav_to_bytes(wav, output_format)
 
 
-def synthesize(
+async def synthesize_with_reference_async(
     text: str,
-    voice: Optional[str] = None,
+    speaker_wav: str,
     lang: str = XTTS_LANG,
     output_format: str = "mp3",
-    user_id: Optional[str] = None,
 ) -> bytes:
-    tts = get_model()
+    """Run synthesize_with_reference() on the TTS thread."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _tts_pool, synthesize_with_reference, text, speaker_wav, lang, output_format
+    )
+
+
+def _load_custom_latents(voice: str) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+    """Compute and pin latents for a bundled custom voice (None if its file is missing)."""
+    ref_path = os.path.join(VOICES_DIR, CUSTOM_VOICES[voice])
+    if not os.path.exists(ref_path):
+        return None
+    latents = _custom_latents[voice] = _get_reference_latents(ref_path)
+    return latents
+
+
+def _resolve_latents(
+    voice: Optional[str],
+    user_id: Optional[str] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Map a voice name (and optional user) to XTTS conditioning latents."""
     voice = voice or "default"
 
     if user_id:
         user_voice_path = get_user_voice_path(user_id, voice)
         if user_voice_path:
-            wav = tts.tts(text=text, language=lang, speaker_wav=user_voice_path)
-            return _wav_to_bytes(wav, output_format)
+            return _get_reference_latents(user_voice_path)
 
         if voice.lower() in ("parent", "user", "my_voice"):
             default_path = get_user_default_voice_path(user_id)
             if default_path:
-                wav = tts.tts(text=text, language=lang, speaker_wav=default_path)
-                return _wav_to_bytes(wav, output_format)
+                return _get_reference_latents(default_path)
 
     if voice in CUSTOM_VOICES:
-        ref_path = os.path.join(VOICES_DIR, CUSTOM_VOICES[voice])
-        if not os.path.exists(ref_path):
-            print(f"[TTS WARNING] Custom voice file not found: {ref_path}, "
-                  f"falling back to default")
-            speaker = _validate_speaker(DEFAULT_SPEAKER)
-            wav = tts.tts(text=text, language=lang, speaker=speaker)
-        else:
-            wav = tts.tts(text=text, language=lang, speaker_wav=ref_path)
-    else:
-        if voice != "default":
-            print(f"[TTS WARNING] Unknown voice '{voice}', using default")
-        speaker = _validate_speaker(DEFAULT_SPEAKER)
-        wav = tts.tts(text=text, language=lang, speaker=speaker)
+        latents = _custom_latents.get(voice) or _load_custom_latents(voice)
+        if latents is not None:
+            return latents
+        log.warning("Custom voice file not found for '%s', falling back to default", voice)
+    elif voice != "default":
+        log.warning("Unknown voice '%s', using default", voice)
+    return _get_speaker_latents(_validate_speaker(DEFAULT_SPEAKER))
+
 
+def synthesize(
+    text: str,
+    voice: Optional[str] = None,
+    lang: str = XTTS_LANG,
+    output_format: str = "mp3",
+    user_id: Optional[str] = None,
+) -> bytes:
+    wav = _inference(text, lang, _resolve_latents(voice, user_id))
     return _wav_to_bytes(wav, output_format)
 
 
+def _stream_audio(
+    text: str,
+    voice: Optional[str],
+    lang: str,
+    user_id: Optional[str],
+    output_format: str,
+) -> Iterator[bytes]:
+    xtts = get_model().synthesizer.tts_model
+    config = xtts.config
+    gpt_cond_latent, speaker_embedding = _resolve_latents(voice, user_id)
+    mp3 = Mp3StreamEncoder(SAMPLE_RATE) if output_format == "mp3" else None
+    for chunk in xtts.inference_stream(
+        text,
+        lang,
+        gpt_cond_latent,
+        speaker_embedding,
+        stream_chunk_size=20,
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+        enable_text_splitting=True,
+    ):
+        samples = chunk.float().cpu().numpy()
+        data = mp3.encode(samples) if mp3 else to_pcm16(samples).tobytes()
+        if data:
+            yield data
+    if mp3:
+        yield mp3.flush()
+
+
+# Queued after a stream's last chunk
+_STREAM_END = object()
+
+
+def _run_stream(
+    text: str,
+    voice: Optional[str],
+    lang: str,
+    user_id: Optional[str],
+    output_format: str,
+    emit: Callable[[object], None],
+    stop: threading.Event,
+) -> None:
+    """Run one stream to completion on the TTS thread, passing each chunk,
+    then _STREAM_END (or the exception raised), to `emit`.
+
+    XTTS keeps per-utterance decoder state on the shared model (the GPT
+    prefix embedding stored by gpt_inference), so a stream holds the TTS
+    thread from its first token to its last instead of interleaving with
+    other jobs. `stop` ends it early once the client has gone.
+    """
+    try:
+        with torch.inference_mode(), _autocast():
+            with contextlib.closing(_stream_audio(text, voice, lang, user_id, output_format)) as chunks:
+                for data in chunks:
+                    if stop.is_set():
+                        return
+                    emit(data)
+    except Exception as e:
+        emit(e)
+    else:
+        emit(_STREAM_END)
+
+
+async def _iter_once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def synthesize_stream(
+    text: str,
+    voice: Optional[str] = None,
+    lang: str = XTTS_LANG,
+    user_id: Optional[str] = None,
+    output_format: str = "mp3",
+) -> AsyncIterator[bytes]:
+    """Start synthesis and return an iterator over audio as XTTS generates
+    it (~every 20 GPT tokens).
+
+    `output_format` is "mp3" (MP3 frames) or "pcm" (raw 16-bit mono
+    little-endian samples at SAMPLE_RATE).
+
+    The whole stream is one job on the TTS thread; chunks reach the caller
+    through a queue. The first chunk is awaited before this returns, so
+    failures raise here (a 500) rather than truncating a 200 body. A
+    repeated request is answered from the output cache in one chunk.
+    """
+    key = _output_key(text, voice, lang, output_format, user_id)
+    cached = _get_output(key)
+    if cached is not None:
+        return _iter_once(cached)
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def emit(item: object) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    loop.run_in_executor(
+        _tts_pool, _run_stream, text, voice, lang, user_id, output_format, emit, stop
+    )
+    try:
+        first = await queue.get()
+    except BaseException:
+        stop.set()
+        raise
+    if isinstance(first, Exception):
+        raise first
+    return _drain_stream(queue, first, stop, key)
+
+
+async def _drain_stream(
+    queue: asyncio.Queue,
+    item: object,
+    stop: threading.Event,
+    key: Optional[bytes],
+) -> AsyncIterator[bytes]:
+    parts = []
+    try:
+        while item is not _STREAM_END:
+            if isinstance(item, Exception):
+                raise item
+            parts.append(item)
+            yield item
+            item = await queue.get()
+    finally:
+        # Client disconnects land here; let the TTS thread move on
+        stop.set()
+    # Only reached when the stream ran to completion
+    _put_output(key, b"".join(parts))
+
+
+def _output_key(
+    text: str,
+    voice: Optional[str],
+    lang: str,
+    output_format: str,
+    user_id: Optional[str],
+) -> Optional[bytes]:
+    """Cache key for a request, or None if its output must not be cached."""
+    if user_id or not MAX_OUTPUT_CACHE_BYTES:
+        return None
+    raw = "\0".join((text, voice or "default", lang, output_format))
+    return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+
+def _get_output(key: Optional[bytes]) -> Optional[bytes]:
+    data = _output_cache.get(key) if key is not None else None
+    if data is not None:
+        _output_cache.move_to_end(key)
+    return data
+
+
+def _put_output(key: Optional[bytes], data: bytes) -> None:
+    global _output_cache_bytes
+    if key is None or key in _output_cache or len(data) > MAX_OUTPUT_CACHE_BYTES:
+        return
+    _output_cache[key] = data
+    _output_cache_bytes += len(data)
+    while _output_cache_bytes > MAX_OUTPUT_CACHE_BYTES:
+        _, evicted = _output_cache.popitem(last=False)
+        _output_cache_bytes -= len(evicted)
+
+
+def _synthesize_batch(requests: List[Dict]) -> List[Union[bytes, Exception]]:
+    """Synthesize a drained batch; identical requests share one model run.
+
+    Only buffered requests (wav from /tts) arrive here, so this dedup does
+    not cover concurrent identical streams.
+    """
+    done: Dict[Tuple, Union[bytes, Exception]] = {}
+    outputs: List[Union[bytes, Exception]] = []
+    for kwargs in requests:
+        key = tuple(kwargs.values())
+        if key not in done:
+            try:
+                done[key] = synthesize(**kwargs)
+            except Exception as e:
+                done[key] = e
+        outputs.append(done[key])
+    return outputs
+
+
+class _Batcher:
+    """Coalesce concurrent buffered (synthesize_async) requests into one
+    executor hop.
+
+    XTTS has no batched forward pass, so a drained batch is ordered by
+    language, voice and text length (keeping speaker latents and compiled
+    shapes warm) and synthesized back to back on the TTS thread. Duplicate
+    requests in a batch (e.g. several clients asking for the same prompt)
+    are synthesized once. Streamed mp3/pcm from synthesize_stream bypasses
+    the batcher; repeats there are only served by the output cache once a
+    first stream has completed.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, kwargs: Dict) -> bytes:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((kwargs, future))
+        return await future
+
+    async def _drain(self) -> List[Tuple[Dict, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._drain()
+            batch.sort(key=lambda item: (
+                item[0]["lang"], item[0]["voice"] or "", len(item[0]["text"])
+            ))
+            try:
+                outputs = await asyncio.get_running_loop().run_in_executor(
+                    _tts_pool, _synthesize_batch, [kwargs for kwargs, _ in batch]
+                )
+            except Exception as e:
+                outputs = [e] * len(batch)
+            for (_, future), output in zip(batch, outputs):
+                if future.done():
+                    continue
+                if isinstance(output, Exception):
+                    future.set_exception(output)
+                else:
+                    future.set_result(output)
+
+
+_batcher = _Batcher(TTS_MAX_BATCH, TTS_MAX_WAIT_MS / 1000)
+
+
+async def synthesize_async(
+    text: str,
+    voice: Optional[str] = None,
+    lang: str = XTTS_LANG,
+    output_format: str = "mp3",
+    user_id: Optional[str] = None,
+) -> bytes:
+    """Queue a synthesize() call on the TTS thread and await the audio.
+
+    Repeated requests for built-in/bundled voices are served from the
+    output cache without queuing.
+    """
+    key = _output_key(text, voice, lang, output_format, user_id)
+    cached = _get_output(key)
+    if cached is not None:
+        return cached
+
+    audio = await _batcher.submit({
+        "text": text,
+        "voice": voice,
+        "lang": lang,
+        "output_format": output_format,
+        "user_id": user_id,
+    })
+    _put_output(key, audio)
+    return audio
+
+
+# Short / medium / long prompts, so the compiled GPT decoder and HiFi-GAN
+# see the sequence lengths real replies hit before the first user does
+_WARMUP_TEXTS = (
+    "Привет!",
+    "Ура! Расскажи мне, что ты сегодня делал?",
+    "Ого, как интересно! Давай поиграем в слова: я называю животное, "
+    "а ты говоришь, какой звук оно издаёт. Готов?",
+)
+
+
 def warmup() -> None:
     try:
-        audio = synthesize("Привет!", lang=XTTS_LANG)
-        if len(audio) < 100:
-            print("[TTS WARNING] Warmup produced suspiciously small audio")
-        else:
-            print("TTS warmup complete")
+        _get_valid_speakers()
+        _get_speaker_latents(_validate_speaker(DEFAULT_SPEAKER))
+        for voice in CUSTOM_VOICES:
+            _load_custom_latents(voice)
+
+        # Without torch.compile there are no shape-specialized graphs to prime
+        texts = _WARMUP_TEXTS if XTTS_COMPILE else _WARMUP_TEXTS[:1]
+        for text in texts:
+            start = time.perf_counter()
+            audio = synthesize(text, lang=XTTS_LANG)
+            log.info("TTS warmup: %d chars in %.2fs", len(text), time.perf_counter() - start)
+            if len(audio) < 100:
+                log.warning("TTS warmup produced suspiciously small audio")
+
+        # inference_stream decodes in fixed-size chunks through its own path
+        start = time.perf_counter()
+        with torch.inference_mode(), _autocast():
+            for _ in _stream_audio(_WARMUP_TEXTS[0], None, XTTS_LANG, None, "mp3"):
+                pass
+        log.info("TTS warmup: stream in %.2fs", time.perf_counter() - start)
+        log.info("TTS warmup complete")
     except Exception as e:
-        print(f"TTS warmup failed: {e}")
\ No newline at end of file
+        log.error("TTS warmup failed: %s", e, exc_info=True)
+
+
+async def warmup_async() -> None:
+    """Run warmup() on the TTS thread.
+
+    Requests that arrive while the model is still loading queue behind it
+    on the same thread instead of loading or running XTTS concurrently.
+    """
+    await asyncio.get_running_loop().run_in_executor(_tts_pool, warmup)
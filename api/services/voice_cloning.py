@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from datetime import datetime
 import json
 
+import av
 import numpy as np
 from pydub import AudioSegment
 from pydub.effects import normalize, high_pass_filter, low_pass_filter
@@ -63,6 +64,35 @@ def _generate_voice_id(user_id: str, audio_hash: str) -> str:
     return f"voice_{timestamp}_{audio_hash[:8]}"
 
 
+def _decode(audio_bytes: bytes, audio_format: Optional[str] = None) -> AudioSegment:
+    """Decode upload bytes to a 16-bit AudioSegment in-process with PyAV.
+
+    AudioSegment.from_file() pipes every non-WAV upload through an ffmpeg
+    subprocess; this keeps the native sample rate and channel count (which
+    validation reports) without spawning one.
+    """
+    src = io.BytesIO(audio_bytes)
+    try:
+        container = av.open(src)
+    except av.FFmpegError:
+        if not audio_format:
+            raise
+        src.seek(0)
+        container = av.open(src, format="mp4" if audio_format == "m4a" else audio_format)
+
+    with container:
+        stream = container.streams.audio[0]
+        rate = stream.codec_context.sample_rate
+        channels = stream.codec_context.channels
+        resampler = av.AudioResampler(format="s16", layout=stream.layout.name, rate=rate)
+        chunks = []
+        for frame in container.decode(stream):
+            chunks.extend(f.to_ndarray().tobytes() for f in resampler.resample(frame))
+        chunks.extend(f.to_ndarray().tobytes() for f in resampler.resample(None))
+
+    return AudioSegment(data=b"".join(chunks), sample_width=2, frame_rate=rate, channels=channels)
+
+
 def validate_audio(
     audio_bytes: bytes,
     audio_format: Optional[str] = None,
@@ -74,14 +104,8 @@ def validate_audio(
     - Sample rate sufficient
     - Audio is decodable
     """
-    errors = []
-    warnings = []
-    
     try:
-        if audio_format:
-            audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format=audio_format)
-        else:
-            audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
+        audio = _decode(audio_bytes, audio_format)
     except Exception as e:
         return VoiceValidationResult(
             valid=False,
@@ -91,6 +115,12 @@ def validate_audio(
             errors=[f"Could not decode audio: {e}"],
             warnings=[],
         )
+    return _validate(audio)
+
+
+def _validate(audio: AudioSegment) -> VoiceValidationResult:
+    errors = []
+    warnings = []
     
     duration = audio.duration_seconds
     sample_rate = audio.frame_rate
@@ -163,12 +193,13 @@ def preprocess_audio(
     Returns:
         Tuple of (processed WAV bytes, preprocessing metadata)
     """
-    # Load audio
-    if audio_format:
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes), format=audio_format)
-    else:
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-    
+    return _preprocess(_decode(audio_bytes, audio_format), trim_to_optimal)
+
+
+def _preprocess(
+    audio: AudioSegment,
+    trim_to_optimal: bool = True,
+) -> Tuple[bytes, Dict[str, Any]]:
     original_duration = audio.duration_seconds
     original_sample_rate = audio.frame_rate
     original_channels = audio.channels
@@ -277,13 +308,17 @@ def save_voice(
     """
     _ensure_dirs()
     
-    # Validate first
-    validation = validate_audio(audio_bytes, audio_format)
+    # Decode once, then validate and preprocess the same samples
+    try:
+        audio = _decode(audio_bytes, audio_format)
+    except Exception as e:
+        raise ValueError(f"Could not decode audio: {e}")
+    validation = _validate(audio)
     if not validation.valid:
         raise ValueError("; ".join(validation.errors))
     
     # Preprocess
-    processed_bytes, preprocess_meta = preprocess_audio(audio_bytes, audio_format)
+    processed_bytes, preprocess_meta = _preprocess(audio)
     
     # Generate voice ID
     audio_hash = hashlib.md5(audio_bytes).hexdigest()
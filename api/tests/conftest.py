@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules import each other as top-level packages (`from config import ...`),
+# the way uvicorn runs them from api/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,72 @@
+"""Streams and batched synthesis must not interleave on the shared XTTS model."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from services import tts
+
+CHUNKS = 5
+CHUNK_SAMPLES = 240
+
+
+class _FakeXTTS:
+    """Stands in for the XTTS model with the same shared-state hazard.
+
+    Like GPT.compute_embeddings / store_prefix_emb, each utterance records
+    its prefix on the model, and every later decode step reads it back. A
+    step that finds another request's prefix emits inverted ("garbage")
+    samples.
+    """
+
+    config = SimpleNamespace(
+        temperature=0.75, length_penalty=1.0, repetition_penalty=10.0, top_k=50, top_p=0.85
+    )
+
+    def __init__(self):
+        self.prefix = None
+
+    def inference_stream(self, text, lang, gpt_cond_latent, speaker_embedding, **kwargs):
+        self.prefix = text
+        for _ in range(CHUNKS):
+            time.sleep(0.01)
+            yield torch.full((CHUNK_SAMPLES,), 0.5 if self.prefix == text else -0.5)
+
+    def inference(self, text, lang, gpt_cond_latent, speaker_embedding, **kwargs):
+        self.prefix = text
+        time.sleep(0.01)
+        return {"wav": np.full(CHUNK_SAMPLES, 0.5, dtype=np.float32)}
+
+
+async def _collect(audio) -> bytes:
+    return b"".join([chunk async for chunk in audio])
+
+
+async def _run_concurrently():
+    streams = [
+        tts.synthesize_stream("Привет!", output_format="pcm"),
+        tts.synthesize_stream("Как дела?", output_format="pcm"),
+    ]
+    wav = tts.synthesize_async("Пока!", output_format="wav")
+    *iterators, wav_bytes = await asyncio.gather(*streams, wav)
+    pcm = await asyncio.gather(*(_collect(audio) for audio in iterators))
+    return pcm, wav_bytes
+
+
+def test_streams_and_wav_do_not_share_model_state(monkeypatch):
+    fake = _FakeXTTS()
+    model = SimpleNamespace(synthesizer=SimpleNamespace(tts_model=fake))
+    monkeypatch.setattr(tts, "get_model", lambda: model)
+    monkeypatch.setattr(tts, "_resolve_latents", lambda voice, user_id=None: (None, None))
+    monkeypatch.setattr(tts, "MAX_OUTPUT_CACHE_BYTES", 0)
+
+    pcm, wav_bytes = asyncio.run(_run_concurrently())
+
+    for body in pcm:
+        samples = np.frombuffer(body, dtype="<i2")
+        assert samples.size == CHUNKS * CHUNK_SAMPLES
+        assert (samples > 0).all(), "stream decoded with another request's prefix"
+    assert np.frombuffer(wav_bytes[44:], dtype="<i2").size == CHUNK_SAMPLES
@@ -1,62 +1,254 @@
-from typing import Optional
+import io
+import re
+import struct
+from functools import lru_cache
+from typing import Optional, Union
 
+import av
+import numpy as np
+import soundfile as sf
+from fastapi import HTTPException, UploadFile
 
+from log import log
+
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """Read an upload in chunks, failing with 413 as soon as it exceeds max_bytes.
+
+    Avoids buffering an oversized body in full before rejecting it. Chunks
+    are joined once at the end, so the body is copied a single time and the
+    result can be handed to io.BytesIO / storage uploads without another copy.
+    """
+    chunks = []
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail="Upload too large")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+# Exact MIME type -> format, including common mobile variants
+_CT_MAP = {
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/vnd.wave": "wav",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/webm": "webm",
+    "audio/aac": "m4a",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "audio/m4a": "m4a",
+    "audio/3gpp": "3gp",
+    "audio/3gpp2": "3gp",
+    "audio/amr": "amr",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/x-caf": "caf",
+    "video/webm": "webm",
+}
+
+# Substring -> format, for non-standard types not in _CT_MAP
+_CT_FALLBACK = {
+    "wav": "wav",
+    "mpeg": "mp3",
+    "mp3": "mp3",
+    "ogg": "ogg",
+    "opus": "ogg",
+    "webm": "webm",
+    "aac": "m4a",
+    "mp4": "m4a",
+    "m4a": "m4a",
+    "3gp": "3gp",
+    "amr": "amr",
+    "flac": "flac",
+    "caf": "caf",
+}
+# One C-level scan for all fallback keys instead of a Python loop of `in` checks
+_CT_FALLBACK_RE = re.compile("|".join(map(re.escape, _CT_FALLBACK)), re.IGNORECASE)
+
+
+@lru_cache(maxsize=64)
 def guess_audio_format(content_type: Optional[str]) -> Optional[str]:
     """Guess audio format from Content-Type header.
 
     Covers standard MIME types plus common mobile variants
     (Flutter/Android/iOS often send non-standard content types).
+    Clients send a handful of distinct values, so results are cached.
     """
     if not content_type:
         return None
-    ct = content_type.lower().strip()
-
-    exact_map = {
-        "audio/wav": "wav",
-        "audio/x-wav": "wav",
-        "audio/wave": "wav",
-        "audio/vnd.wave": "wav",
-        "audio/mpeg": "mp3",
-        "audio/mp3": "mp3",
-        "audio/ogg": "ogg",
-        "audio/opus": "ogg",
-        "audio/webm": "webm",
-        "audio/aac": "m4a",
-        "audio/mp4": "m4a",
-        "audio/x-m4a": "m4a",
-        "audio/m4a": "m4a",
-        "audio/3gpp": "3gp",
-        "audio/3gpp2": "3gp",
-        "audio/amr": "amr",
-        "audio/flac": "flac",
-        "audio/x-flac": "flac",
-        "audio/x-caf": "caf",
-        "video/webm": "webm",
-    }
-
-    base_type = ct.split(";")[0].strip()
-    if base_type in exact_map:
-        return exact_map[base_type]
-
-    fallback_map = {
-        "wav": "wav",
-        "mpeg": "mp3",
-        "mp3": "mp3",
-        "ogg": "ogg",
-        "opus": "ogg",
-        "webm": "webm",
-        "aac": "m4a",
-        "mp4": "m4a",
-        "m4a": "m4a",
-        "3gp": "3gp",
-        "amr": "amr",
-        "flac": "flac",
-        "caf": "caf",
-    }
-
-    for key, fmt in fallback_map.items():
-        if key in ct:
-            return fmt
-
-    print(f"[AUDIO] Unknown content type: {ct}")
-    return None
\ No newline at end of file
+
+    # Clients almost always send lowercase MIME types; only fold case on a miss
+    mime = content_type.split(";", 1)[0].strip()
+    fmt = _CT_MAP.get(mime) or _CT_MAP.get(mime.lower())
+    if fmt:
+        return fmt
+
+    match = _CT_FALLBACK_RE.search(content_type)
+    if match:
+        return _CT_FALLBACK[match.group().lower()]
+
+    log.warning("Unknown audio content type: %s", content_type)
+    return None
+
+
+def decode_to_mono(
+    data: Union[bytes, bytearray],
+    sample_rate: int = 16000,
+    audio_format: Optional[str] = None,
+) -> np.ndarray:
+    """Decode audio bytes to mono float32 PCM at `sample_rate`.
+
+    Runs libav in-process via PyAV instead of piping through an ffmpeg
+    subprocess. The container is probed from the bytes; `audio_format`
+    is only used as a fallback hint when probing fails.
+    """
+    src = io.BytesIO(data)
+
+    # Fast path: WAV/FLAC already at the target rate and mono needs no resampling
+    if (data[:4] == b"RIFF" and data[8:12] == b"WAVE") or data[:4] == b"fLaC":
+        try:
+            samples, sr = sf.read(src, dtype="float32", always_2d=False)
+        except sf.LibsndfileError:
+            samples, sr = None, None
+        if sr == sample_rate and samples.ndim == 1:
+            return samples
+        src.seek(0)
+
+    try:
+        container = av.open(src)
+    except av.FFmpegError:
+        if not audio_format:
+            raise
+        src.seek(0)
+        container = av.open(src, format="mp4" if audio_format == "m4a" else audio_format)
+
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=sample_rate)
+    frames = []
+    resampled = False
+    with container:
+        for frame in container.decode(audio=0):
+            # Mono float frames at the target rate (e.g. 16kHz mono MP3/AAC)
+            # are already in the output layout; skip the swresample pass
+            if (
+                not resampled
+                and frame.sample_rate == sample_rate
+                and frame.layout.name == "mono"
+                and frame.format.name in ("flt", "fltp")
+            ):
+                frames.append(frame.to_ndarray().reshape(1, -1))
+                continue
+            resampled = True
+            frames.extend(f.to_ndarray() for f in resampler.resample(frame))
+        if resampled:
+            frames.extend(f.to_ndarray() for f in resampler.resample(None))
+
+    if not frames:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(frames, axis=1).reshape(-1)
+
+
+# CBR for 24 kHz mono speech (MPEG-2 Layer III); about a third of 128 kbps
+MP3_BIT_RATE = 48000
+
+# libavcodec's FF_QP2LAMBDA: global_quality is LAME's VBR quality in lambda units
+_FF_QP2LAMBDA = 118
+
+
+class Mp3StreamEncoder:
+    """Incremental mono float32 -> MP3 encoder for streamed responses.
+
+    Uses the libmp3lame codec context directly (no container), so the
+    packets it returns are plain MP3 frames that can be sent as they come.
+    Encodes CBR at `bit_rate` by default: without a container there is no
+    Xing/Info header, and players estimate duration and seek offsets from
+    the first frame's bitrate, which is only right for CBR. `vbr_quality`
+    (0 best .. 9 smallest, like ffmpeg's -q:a) selects LAME VBR for callers
+    that add that header themselves.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        vbr_quality: Optional[int] = None,
+        bit_rate: int = MP3_BIT_RATE,
+    ):
+        self.sample_rate = sample_rate
+        self._codec = av.CodecContext.create("libmp3lame", "w")
+        self._codec.sample_rate = sample_rate
+        self._codec.layout = "mono"
+        self._codec.format = "fltp"
+        if vbr_quality is None:
+            self._codec.bit_rate = bit_rate
+        else:
+            self._codec.options = {
+                "flags": "+qscale",
+                "global_quality": str(vbr_quality * _FF_QP2LAMBDA),
+            }
+
+    def encode(self, samples: np.ndarray) -> bytes:
+        """Encode a chunk; returns whatever complete frames are ready."""
+        frame = av.AudioFrame.from_ndarray(
+            np.ascontiguousarray(samples, dtype=np.float32).reshape(1, -1),
+            format="flt",
+            layout="mono",
+        )
+        frame.sample_rate = self.sample_rate
+        # Packets expose the buffer protocol, so join copies each one once
+        return b"".join(self._codec.encode(frame))
+
+    def flush(self) -> bytes:
+        """Drain the encoder at end of stream."""
+        return b"".join(self._codec.encode(None))
+
+
+def encode_mp3(
+    samples: np.ndarray,
+    sample_rate: int,
+    bit_rate: int = MP3_BIT_RATE,
+) -> bytes:
+    """Encode mono float32 PCM to MP3 with libmp3lame via PyAV.
+
+    Feeds the float array straight into the codec and joins the raw MP3
+    frames into the returned bytes, with no container or BytesIO in between.
+    """
+    encoder = Mp3StreamEncoder(sample_rate, bit_rate=bit_rate)
+    return encoder.encode(samples) + encoder.flush()
+
+
+def to_pcm16(samples: np.ndarray) -> np.ndarray:
+    """Convert float32 PCM in [-1, 1] to int16 with vectorized ufuncs.
+
+    Scales into a single float32 scratch buffer and clips it in place, so
+    the only allocations are that buffer and the int16 result.
+    """
+    scaled = np.multiply(samples, np.float32(32767.0), dtype=np.float32)
+    np.clip(scaled, -32768.0, 32767.0, out=scaled)
+    return scaled.astype(np.int16)
+
+
+# Canonical 44-byte PCM WAV header: RIFF chunk, 16-byte fmt chunk, data chunk
+_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """Encode mono float32 PCM to 16-bit WAV.
+
+    Converts with to_pcm16() and joins a packed header with the sample
+    buffer, so the audio is copied once into the returned bytes.
+    """
+    pcm = to_pcm16(samples)
+    header = _WAV_HEADER.pack(
+        b"RIFF", 36 + pcm.nbytes, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", pcm.nbytes,
+    )
+    return b"".join((header, pcm))
@@ -0,0 +1,48 @@
+"""Export the STT model to ONNX and quantize it to int8 for ONNX Runtime.
+
+Usage:
+    python scripts/export_whisper_onnx.py [model_name] [output_dir]
+
+The output directory is what WHISPER_ONNX_DIR should point to when running
+with WHISPER_BACKEND=onnx. Requires `pip install optimum[onnxruntime]`.
+"""
+
+import os
+import sys
+
+from optimum.onnxruntime import ORTModelForSpeechSeq2Seq, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import WhisperProcessor
+
+ONNX_FILES = ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx")
+
+
+def main() -> None:
+    model_name = sys.argv[1] if len(sys.argv) > 1 else os.getenv(
+        "WHISPER_MODEL", "qymyz/whisper-tiny-russian-dysarthria"
+    )
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else "models/whisper-onnx"
+    fp32_dir = os.path.join(output_dir, "fp32")
+
+    print(f"Exporting {model_name} -> {fp32_dir}")
+    model = ORTModelForSpeechSeq2Seq.from_pretrained(model_name, export=True, use_merged=False)
+    model.save_pretrained(fp32_dir)
+    processor = WhisperProcessor.from_pretrained(model_name)
+    processor.save_pretrained(fp32_dir)
+
+    # Dynamic int8 with per-channel weights; maps onto VNNI/AMX instructions
+    # on CPUs that have them and is still correct elsewhere.
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+    for file_name in ONNX_FILES:
+        print(f"Quantizing {file_name}")
+        quantizer = ORTQuantizer.from_pretrained(fp32_dir, file_name=file_name)
+        quantizer.quantize(save_dir=output_dir, quantization_config=qconfig, file_suffix=None)
+
+    model.config.save_pretrained(output_dir)
+    model.generation_config.save_pretrained(output_dir)
+    processor.save_pretrained(output_dir)
+    print(f"Done: {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
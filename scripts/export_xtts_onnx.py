@@ -0,0 +1,48 @@
+"""Export the XTTS HiFi-GAN waveform decoder to ONNX for ONNX Runtime.
+
+Usage:
+    python scripts/export_xtts_onnx.py [output_path]
+
+The output file is what XTTS_VOCODER_ONNX should point to when running
+with XTTS_VOCODER=onnx. The autoregressive GPT is not exported; it keeps
+running in PyTorch. Requires `pip install onnx`.
+"""
+
+import os
+import sys
+
+import torch
+from TTS.api import TTS
+
+GPT_LATENT_DIM = 1024
+SPEAKER_EMBEDDING_DIM = 512
+
+
+def main() -> None:
+    output_path = sys.argv[1] if len(sys.argv) > 1 else "models/xtts-hifigan.onnx"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    print("Loading XTTS v2")
+    model = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to("cpu")
+    decoder = model.synthesizer.tts_model.hifigan_decoder.eval()
+
+    # Representative shapes; the latent length is dynamic
+    latents = torch.randn(1, 64, GPT_LATENT_DIM)
+    speaker_embedding = torch.randn(1, SPEAKER_EMBEDDING_DIM, 1)
+
+    print(f"Exporting HiFi-GAN decoder -> {output_path}")
+    with torch.inference_mode():
+        torch.onnx.export(
+            decoder,
+            (latents, {"g": speaker_embedding}),
+            output_path,
+            input_names=["latents", "g"],
+            output_names=["wav"],
+            dynamic_axes={"latents": {1: "frames"}, "wav": {2: "samples"}},
+            opset_version=17,
+        )
+    print(f"Done: {output_path}")
+
+
+if __name__ == "__main__":
+    main()